@@ -0,0 +1,120 @@
+"""
+Alarm events, built from the transitions of the alarm state (`alarm_status`, `alarm_ops_state`,
+`alarm_name`) of the readings of a device.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from .constants import ALARM_STATUS_ONLINE, ALARM_NAME_OK
+from .models import AlarmEvent, InverterData
+from ..base.utils.timezone import localtime
+
+ALARM_ANALYSIS_HEADER = ['Inverter', 'Alarm', 'Status', 'Operation State', 'Start', 'End', 'Duration (min)']
+
+
+def get_alarm_state(alarm_status, alarm_ops_state, alarm_name):
+    return alarm_status or '', alarm_ops_state or '', alarm_name or ''
+
+
+def is_alarm_state(state, code):
+    return bool(state and state != ALARM_STATUS_ONLINE) or bool(code and code != ALARM_NAME_OK)
+
+
+def new_alarm_event(device_id, state, started_at):
+    status, ops_state, code = state
+    return AlarmEvent(device_id=device_id, state=status, ops_state=ops_state, code=code,
+                      is_alarm=is_alarm_state(status, code), started_at=started_at)
+
+
+def record_alarm_state(device, inverter_data):
+    """
+    Closes the open event of the device and opens a new one when the alarm state of the stored
+    reading differs from it. Returns the new event, or None when the state did not change.
+    """
+    state = get_alarm_state(inverter_data.alarm_status, inverter_data.alarm_ops_state, inverter_data.alarm_name)
+    current = AlarmEvent.objects.filter(device=device, ended_at__isnull=True).order_by('-started_at').first()
+    if current is not None and (current.state, current.ops_state, current.code) == state:
+        return None
+    with transaction.atomic():
+        if current is not None:
+            AlarmEvent.objects.filter(pk=current.pk).update(ended_at=inverter_data.created_at)
+        event = new_alarm_event(device.pk, state, inverter_data.created_at)
+        event.save()
+    return event
+
+
+def iter_alarm_events(device_id, rows, event=None):
+    """
+    Yields the events of `(created_at, alarm_status, alarm_ops_state, alarm_name)` rows ordered by time,
+    the last one being left open. `event` is the event in progress before the first row, it is
+    continued while the rows keep its state.
+    """
+    for created_at, alarm_status, alarm_ops_state, alarm_name in rows:
+        state = get_alarm_state(alarm_status, alarm_ops_state, alarm_name)
+        if event is not None and (event.state, event.ops_state, event.code) == state:
+            continue
+        if event is not None:
+            event.ended_at = created_at
+            yield event
+        event = new_alarm_event(device_id, state, created_at)
+    if event is not None:
+        yield event
+
+
+def rebuild_alarm_events(device, batch_size=2000):
+    """
+    Replaces the events of `device` from its first stored reading on with the ones of its readings,
+    streamed in chunks. The events before it are kept as the history of the purged readings: the
+    event spanning the first reading is continued, or ended by it. Returns the number of events
+    written.
+    """
+    readings = InverterData.objects.filter(device=device, is_active=True).order_by('created_at', 'id')
+    first_reading_at = readings.values_list('created_at', flat=True).first()
+    if first_reading_at is None:
+        return 0
+    rows = readings.values_list('created_at', 'alarm_status', 'alarm_ops_state', 'alarm_name')
+    with transaction.atomic():
+        AlarmEvent.objects.filter(device=device, started_at__gte=first_reading_at).delete()
+        spanning = AlarmEvent.objects.filter(
+            Q(ended_at__isnull=True) | Q(ended_at__gte=first_reading_at), device=device).order_by(
+            '-started_at', '-id').first()
+        if spanning is not None:
+            spanning.ended_at = None
+        written = 0
+        events = []
+        for event in iter_alarm_events(device.pk, rows.iterator(chunk_size=batch_size), spanning):
+            if event is spanning:
+                AlarmEvent.objects.filter(pk=event.pk).update(ended_at=event.ended_at)
+                written += 1
+                continue
+            events.append(event)
+            if len(events) >= batch_size:
+                written += len(AlarmEvent.objects.bulk_create(events))
+                events = []
+        written += len(AlarmEvent.objects.bulk_create(events))
+    return written
+
+
+def get_alarm_events(from_date, to_date, **filters):
+    """
+    Alarm events overlapping the `[from_date, to_date]` date range.
+    """
+    return AlarmEvent.objects.filter(Q(ended_at__isnull=True) | Q(ended_at__date__gte=from_date),
+                                     started_at__date__lte=to_date, is_alarm=True, **filters)
+
+
+def get_alarm_analysis_rows(location, from_date, to_date):
+    """
+    Rows of the "Alarm Analysis" report sheet of a location.
+    """
+    events = get_alarm_events(from_date, to_date, device__location=location).select_related('device').order_by(
+        'started_at', 'id')
+    rows = []
+    for event in events:
+        duration = None
+        if event.ended_at is not None:
+            duration = round((event.ended_at - event.started_at).total_seconds() / 60, 1)
+        ended_at = localtime(event.ended_at).replace(tzinfo=None) if event.ended_at else None
+        rows.append([event.device.device_name or event.device.imei, event.code, event.state, event.ops_state,
+                     localtime(event.started_at).replace(tzinfo=None), ended_at, duration])
+    return rows
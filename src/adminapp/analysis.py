@@ -0,0 +1,200 @@
+"""
+Data gap and grid downtime analysis of the devices.
+
+A device is down between two consecutive readings further apart than `DOWNTIME_GAP_SECONDS`, from
+the time the next reading was due (`TELEMETRY_INTERVAL_SECONDS` after the first one), and before its
+first / after its last reading of the window. The timestamps are streamed from the
+database in chunks and every chunk is processed with NumPy in one pass. Long ranges use the daily
+rollups for the days they cover, at day resolution.
+"""
+import datetime
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import InverterData, DeviceDailyRollup
+from ..base.utils.timezone import epoch_ms_array
+
+DOWNTIME_CHUNK_SIZE = 10000
+GRID_DOWNTIME_HEADER = ['Inverter', 'Availability (%)', 'Downtime (min)', 'Outages', 'Longest Outage (min)',
+                       'Longest Outage Start']
+
+
+def to_epoch_ms(value):
+    return int(value.timestamp() * 1000)
+
+
+def from_epoch_ms(value):
+    return datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc)
+
+
+class DowntimeAnalysis(object):
+    """
+    Accumulates the outages of a single device over the `[start, end)` window (epoch milliseconds),
+    for readings expected every `interval`.
+    """
+
+    def __init__(self, start, end, gap, interval):
+        self.start = start
+        self.end = end
+        self.gap = gap
+        self.interval = interval
+        # The window start acts as a reading, so that a late first reading counts as an outage. As no
+        # reading was received, the outage starts with the window.
+        self.previous = start
+        self.previous_is_reading = False
+        self.readings = 0
+        self.downtime = 0
+        self.outage_starts = []
+        self.outage_ends = []
+
+    def feed(self, times):
+        """
+        Adds a chunk of reading times (sorted epoch milliseconds, later than the previous chunk).
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if not len(times):
+            return
+        points = np.concatenate(([self.previous], times))
+        steps = np.diff(points)
+        mask = steps > self.gap
+        # Only the part of a gap after the next reading was due is downtime.
+        due = np.minimum(points[:-1] + self.interval, points[1:])
+        if not self.previous_is_reading:
+            due[0] = self.previous
+        self.add_outages(due[mask], points[1:][mask])
+        self.previous = int(times[-1])
+        self.previous_is_reading = True
+        self.readings += len(times)
+
+    def add_outages(self, starts, ends):
+        """
+        Adds sorted outages, the first one extends the last outage when it continues it (across a day
+        boundary).
+        """
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        if len(starts) and self.outage_ends and self.outage_ends[-1][-1] == starts[0]:
+            self.outage_ends[-1][-1] = ends[0]
+            self.downtime += int(ends[0] - starts[0])
+            starts, ends = starts[1:], ends[1:]
+        if len(starts):
+            self.outage_starts.append(starts)
+            self.outage_ends.append(ends)
+            self.downtime += int((ends - starts).sum())
+
+    def add_day(self, start, end, readings, first=None, last=None):
+        """
+        Adds a day known only by its rollup: a whole day outage without readings. Otherwise the gaps
+        before the `first` and after the `last` reading are outages, and the time between them not
+        covered by `readings` readings `interval` apart is counted as downtime, without outage as the
+        rollup does not tell when it happened.
+        """
+        if readings:
+            first, last = first or start, last or end
+            if first - start > self.gap:
+                self.add_outages([start], [first])
+            self.downtime += max(0, (last - first) - (readings - 1) * self.interval)
+            if end - last > self.gap:
+                self.add_outages([min(last + self.interval, end)], [end])
+        else:
+            self.add_outages([start], [end])
+        self.previous = end
+        self.previous_is_reading = False
+        self.readings += readings
+
+    def get_result(self):
+        if self.end - self.previous > self.gap:
+            due = min(self.previous + self.interval, self.end) if self.previous_is_reading else self.previous
+            self.add_outages([due], [self.end])
+            self.previous = self.end
+            self.previous_is_reading = False
+        starts = np.concatenate(self.outage_starts) if self.outage_starts else np.array([], dtype=np.int64)
+        ends = np.concatenate(self.outage_ends) if self.outage_ends else np.array([], dtype=np.int64)
+        durations = ends - starts
+        window = max(self.end - self.start, 1)
+        longest = int(durations.argmax()) if len(durations) else None
+        return {
+            "from": from_epoch_ms(self.start),
+            "to": from_epoch_ms(self.end),
+            "readings": self.readings,
+            "availability": round(100 * max(0, 1 - self.downtime / window), 2),
+            "downtime_seconds": round(self.downtime / 1000),
+            "outages": [{"start": from_epoch_ms(start), "end": from_epoch_ms(end),
+                         "seconds": round((end - start) / 1000)} for start, end in zip(starts.tolist(), ends.tolist())],
+            "longest_outage": None if longest is None else {
+                "start": from_epoch_ms(int(starts[longest])), "end": from_epoch_ms(int(ends[longest])),
+                "seconds": round(int(durations[longest]) / 1000)},
+        }
+
+
+def get_window(from_date, to_date):
+    """
+    Local midnight of `from_date` to the end of `to_date`, or now if earlier.
+    """
+    from_date = datetime.date.fromisoformat(str(from_date))
+    to_date = datetime.date.fromisoformat(str(to_date))
+    start = timezone.make_aware(datetime.datetime.combine(from_date, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time.min))
+    return start, min(end, timezone.now())
+
+
+def feed_readings(analysis, device, start, end, chunk_size=DOWNTIME_CHUNK_SIZE):
+    times = InverterData.objects.filter(device=device, is_active=True, created_at__gte=start,
+                                        created_at__lt=end).order_by('created_at').values_list('created_at', flat=True)
+    chunk = []
+    for created_at in times.iterator(chunk_size=chunk_size):
+        chunk.append(created_at)
+        if len(chunk) >= chunk_size:
+            analysis.feed(epoch_ms_array(chunk))
+            chunk = []
+    if chunk:
+        analysis.feed(epoch_ms_array(chunk))
+
+
+def get_downtime_analysis(device, from_date, to_date):
+    """
+    Availability, downtime and outages of `device` over the `[from_date, to_date]` date range.
+    Ranges longer than `DOWNTIME_RAW_MAX_DAYS` read the daily rollups for the days they cover.
+    """
+    start, end = get_window(from_date, to_date)
+    analysis = DowntimeAnalysis(to_epoch_ms(start), to_epoch_ms(max(start, end)),
+                                settings.DOWNTIME_GAP_SECONDS * 1000, settings.TELEMETRY_INTERVAL_SECONDS * 1000)
+    resolution = "reading"
+    raw_start = start
+    if end - start > datetime.timedelta(days=settings.DOWNTIME_RAW_MAX_DAYS):
+        rollups = {date: values for date, *values in DeviceDailyRollup.objects.filter(
+            device=device, date__gte=timezone.localtime(start).date(),
+            date__lt=timezone.localtime(end).date()).values_list('date', 'readings', 'first_reading_at',
+                                                                  'last_reading_at')}
+        if rollups:
+            resolution = "day"
+            day = timezone.localtime(start).date()
+            last_day = max(rollups)
+            while day <= last_day:
+                day_start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+                day = day + datetime.timedelta(days=1)
+                day_end = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+                readings, first, last = rollups.get(day_start.date(), (0, None, None))
+                analysis.add_day(to_epoch_ms(day_start), to_epoch_ms(day_end), readings,
+                                 first and to_epoch_ms(first), last and to_epoch_ms(last))
+            raw_start = day_end
+    feed_readings(analysis, device, raw_start, end)
+    result = analysis.get_result()
+    result.update({"device": device.pk, "resolution": resolution})
+    return result
+
+
+def get_grid_downtime_rows(location, from_date, to_date):
+    """
+    Rows of the "Grid Downtime Analysis" report sheet, one per device of the location.
+    """
+    rows = []
+    for device in location.device_set.filter(is_active=True).order_by('id'):
+        result = get_downtime_analysis(device, from_date, to_date)
+        longest = result['longest_outage']
+        longest_start = timezone.localtime(longest['start']).replace(tzinfo=None) if longest else None
+        rows.append([device.device_name or device.imei, result['availability'],
+                     round(result['downtime_seconds'] / 60, 1), len(result['outages']),
+                     round(longest['seconds'] / 60, 1) if longest else 0, longest_start])
+    return rows
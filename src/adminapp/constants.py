@@ -1,2 +1,22 @@
 INVERTER_TYPE_SUNGROW = 'SUNGROW-SGxKTL'
-INVERTER_TYPE_ABB = 'ABB-TRIO-50.0/60.0-TL-OUTD'
\ No newline at end of file
+INVERTER_TYPE_ABB = 'ABB-TRIO-50.0/60.0-TL-OUTD'
+
+REPORT_FORMAT_XLSX = 'xlsx'
+REPORT_FORMAT_CSV = 'csv'
+REPORT_FORMAT_PARQUET = 'parquet'
+REPORT_FORMAT_FEATHER = 'feather'
+
+REPORT_FORMAT_CHOICES = (
+    (REPORT_FORMAT_XLSX, 'Excel'),
+    (REPORT_FORMAT_CSV, 'CSV'),
+    (REPORT_FORMAT_PARQUET, 'Parquet'),
+    (REPORT_FORMAT_FEATHER, 'Feather'),
+)
+
+REPORT_STATUS_GENERATING = 'Generating'
+REPORT_STATUS_SUCCESS = 'Success'
+REPORT_STATUS_ERROR = 'Error'
+REPORT_STATUS_CANCELLED = 'Cancelled'
+
+ALARM_STATUS_ONLINE = 'Online'
+ALARM_NAME_OK = 'OK'
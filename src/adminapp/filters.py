@@ -1,7 +1,8 @@
 from datetime import datetime
 
 import django_filters
-from .models import Location, Device, InverterData, ZipReport
+from .models import Location, Device, InverterData, ZipReport, AlarmEvent
+from ..base.filters import FilterSet
 
 
 class LocationFilter(django_filters.FilterSet):
@@ -26,24 +27,28 @@ class DeviceFilter(django_filters.FilterSet):
         }
 
 
-class InverterDataFilter(django_filters.FilterSet):
+class InverterDataFilter(FilterSet):
     class Meta:
         model = InverterData
         fields = {
             'id': ['exact'],
-            'device': ['exact'],
+            'device': ['exact', 'in'],
             'sid': ['exact', 'icontains'],
             'uid': ['exact', 'icontains'],
             'imei': ['exact', 'icontains'],
             'rcnt': ['exact', 'icontains'],
-            'daily_energy': ['exact', 'icontains'],
-            'total_energy': ['exact', 'icontains'],
-            'op_active_power': ['exact', 'icontains'],
-            'specific_yields': ['exact', 'icontains'],
-            'inverter_op_active_power': ['exact', 'icontains'],
-            'inverter_daily_energy': ['exact', 'icontains'],
-            'inverter_total_energy': ['exact', 'icontains'],
-            'meter_active_power': ['exact', 'icontains'],
+            'created_at': ['gte', 'lte', 'gt', 'lt'],
+            'daily_energy': ['exact', 'gte', 'lte'],
+            'total_energy': ['exact', 'gte', 'lte'],
+            'op_active_power': ['exact', 'gte', 'lte'],
+            'specific_yields': ['exact', 'gte', 'lte'],
+            'inverter_op_active_power': ['exact', 'gte', 'lte'],
+            'inverter_daily_energy': ['exact', 'gte', 'lte'],
+            'inverter_total_energy': ['exact', 'gte', 'lte'],
+            'meter_active_power': ['exact', 'gte', 'lte'],
+            'alarm_status': ['exact', 'in'],
+            'alarm_ops_state': ['exact', 'in'],
+            'alarm_name': ['exact', 'in'],
         }
 
 
@@ -60,3 +65,18 @@ class ZipReportFilter(django_filters.FilterSet):
             'status': ['exact', 'icontains'],
             'location': ['exact',  'icontains'],
         }
+
+
+class AlarmEventFilter(FilterSet):
+    class Meta:
+        model = AlarmEvent
+        fields = {
+            'device': ['exact', 'in'],
+            'device__location': ['exact', 'in'],
+            'code': ['exact', 'in'],
+            'state': ['exact', 'in'],
+            'ops_state': ['exact', 'in'],
+            'is_alarm': ['exact'],
+            'started_at': ['gte', 'lte'],
+            'ended_at': ['gte', 'lte', 'isnull'],
+        }
@@ -0,0 +1,73 @@
+"""
+Fleet overview of the administrators: capacity, live power, today's energy, online devices and the
+best / worst plants by specific yield.
+
+Everything is computed with a handful of grouped queries: today's readings are aggregated per device
+(`get_daily_aggregates`), the live power is the latest reading of the online devices, and the specific
+yields of the plants come from the daily rollups. The plants are ranked with bounded heaps.
+"""
+import datetime
+import heapq
+
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import Location, Device, InverterData, DeviceDailyRollup
+from .retention import get_daily_aggregates
+from .services import ONLINE_WINDOW
+from ..base.utils.timezone import now_local
+
+FLEET_TOP_PLANTS = 5
+FLEET_YIELD_DAYS = 30
+
+
+def get_capacity(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_plant_yields(from_date, to_date):
+    """
+    Energy and specific yield (kWh/kWp, averaged over the inverters) of every active plant over the
+    rolled up days of `[from_date, to_date)`.
+    """
+    plants = DeviceDailyRollup.objects.filter(
+        date__gte=from_date, date__lt=to_date, device__is_active=True, device__location__is_active=True
+    ).values('device__location', 'device__location__name').annotate(
+        energy=Sum('daily_energy'), specific_yields=Sum('specific_yields'),
+        devices=Count('device', distinct=True)).order_by()
+    return [{"location": plant['device__location'], "name": plant['device__location__name'],
+             "energy": round(plant['energy'] or 0, 2),
+             "specific_yield": round((plant['specific_yields'] or 0) / plant['devices'], 2)}
+            for plant in plants]
+
+
+def get_fleet_overview(days=FLEET_YIELD_DAYS, top=FLEET_TOP_PLANTS):
+    now = timezone.now()
+    today = now_local(only_date=True)
+    capacities = Location.objects.filter(is_active=True).values_list('capacity', flat=True)
+    devices = Device.objects.filter(is_active=True, location__is_active=True)
+    online = Q(last_ingest_at__gte=now - ONLINE_WINDOW)
+    counts = devices.aggregate(devices=Count('id'), online=Count('id', filter=online))
+
+    latest_power = InverterData.objects.filter(device=OuterRef('pk'), is_active=True).order_by(
+        '-created_at').values('op_active_power')[:1]
+    live_power = devices.filter(online).annotate(power=Subquery(latest_power)).values_list('power', flat=True)
+    today_energy = [day['daily_energy'] for day in get_daily_aggregates(
+        today, today + datetime.timedelta(days=1), device__is_active=True, device__location__is_active=True)]
+
+    plants = get_plant_yields(today - datetime.timedelta(days=days), today)
+    return {
+        "locations": len(capacities),
+        "capacity": sum(get_capacity(capacity) for capacity in capacities),
+        "devices": counts['devices'],
+        "online": counts['online'],
+        "offline": counts['devices'] - counts['online'],
+        "live_power": round(sum(power or 0 for power in live_power), 2),
+        "today_energy": round(sum(energy or 0 for energy in today_energy), 2),
+        "yield_days": days,
+        "top_plants": heapq.nlargest(top, plants, key=lambda plant: plant['specific_yield']),
+        "bottom_plants": heapq.nsmallest(top, plants, key=lambda plant: plant['specific_yield']),
+    }
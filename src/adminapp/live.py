@@ -0,0 +1,153 @@
+"""
+Live telemetry push, served by the ASGI application (see `src/asgi.py`).
+
+    GET /api/v1/live/?devices=1,2&locations=3&token=<auth token>    Server-Sent Events
+    WS  /api/v1/live/?devices=1,2&locations=3&token=<auth token>    WebSocket, JSON text frames
+
+The token can also be sent in the `Authorization: Token <key>` header. Clients receive the readings
+stored by the ingest view for the subscribed devices and locations (`reading` events), the
+online / offline transitions of the devices (`status` events) and the changes of their alarm
+state (`alarm` events). The offline transitions are published by the `publish_device_status` beat
+task, which reaches the ASGI processes through the Redis broker only.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import Device
+from .services import get_user_location_ids
+from ..base.authentication import CachedTokenAuthentication
+from ..base.pubsub import get_pubsub
+
+LIVE_PATH = '/api/v1/live/'
+
+
+def get_id_list(params, name):
+    try:
+        return sorted({int(value) for values in params.get(name, []) for value in values.split(',') if value})
+    except ValueError:
+        return None
+
+
+@sync_to_async
+def get_live_channels(scope, params):
+    """
+    Returns `(status, channels)`, the channels being the subscription of the authorized user.
+    """
+    close_old_connections()
+    try:
+        key = params.get('token', [None])[0]
+        headers = dict(scope.get('headers', []))
+        authorization = headers.get(b'authorization', b'').decode('latin-1').split()
+        if key is None and len(authorization) == 2 and authorization[0].lower() == 'token':
+            key = authorization[1]
+        if not key:
+            return 401, None
+        try:
+            user, token = CachedTokenAuthentication().authenticate_credentials(key)
+        except AuthenticationFailed:
+            return 401, None
+
+        device_ids = get_id_list(params, 'devices')
+        location_ids = get_id_list(params, 'locations')
+        if device_ids is None or location_ids is None or not (device_ids or location_ids):
+            return 400, None
+        if not user.is_superuser:
+            allowed = get_user_location_ids(user)
+            if not set(location_ids).issubset(allowed) or \
+                    Device.objects.filter(pk__in=device_ids).exclude(location__in=allowed).exists():
+                return 403, None
+        return 200, ['device:{}'.format(pk) for pk in device_ids] + \
+               ['location:{}'.format(pk) for pk in location_ids]
+    finally:
+        close_old_connections()
+
+
+class LiveTelemetryApp(object):
+    """
+    ASGI application of the live endpoints, HTTP requests are answered with an event stream.
+    """
+    keepalive = 15
+
+    def __init__(self, pubsub=None):
+        self.pubsub = pubsub
+
+    async def __call__(self, scope, receive, send):
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        if scope['type'] == 'websocket':
+            message = await receive()
+            if message['type'] != 'websocket.connect':
+                return
+        status, channels = await get_live_channels(scope, params)
+        if status != 200:
+            return await self.reject(scope, send, status)
+
+        subscription = (self.pubsub or get_pubsub()).subscribe(channels)
+        try:
+            if scope['type'] == 'websocket':
+                await send({'type': 'websocket.accept'})
+                await self.stream(subscription, receive, send, self.send_frame, 'websocket.disconnect')
+            else:
+                await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                    (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')]})
+                await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+                await self.stream(subscription, receive, send, self.send_event, 'http.disconnect')
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            subscription.close()
+
+    async def reject(self, scope, send, status):
+        if scope['type'] == 'websocket':
+            return await send({'type': 'websocket.close', 'code': 4000 + status})
+        body = json.dumps({"detail": "Live updates are not available for this request."}).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def stream(self, subscription, receive, send, send_message, disconnect):
+        """
+        Forwards the subscription messages until the client disconnects, with a keepalive when idle.
+        """
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive, disconnect))
+        message = None
+        try:
+            while True:
+                if message is None:
+                    message = asyncio.ensure_future(subscription.get())
+                done, pending = await asyncio.wait({message, disconnected}, timeout=self.keepalive,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    return
+                if message in done:
+                    await send_message(send, message.result())
+                    message = None
+                else:
+                    await send_message(send, None)
+        finally:
+            disconnected.cancel()
+            if message is not None:
+                message.cancel()
+
+    @staticmethod
+    async def wait_disconnect(receive, disconnect):
+        while (await receive())['type'] != disconnect:
+            pass
+
+    @staticmethod
+    async def send_event(send, message):
+        if message is None:
+            body = b': keepalive\n\n'
+        else:
+            body = 'event: {}\ndata: {}\n\n'.format(message.get('type', 'message'), json.dumps(message))
+            body = body.encode('utf-8')
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    @staticmethod
+    async def send_frame(send, message):
+        if message is not None:
+            await send({'type': 'websocket.send', 'text': json.dumps(message)})
@@ -0,0 +1,260 @@
+"""
+Load testing harness of the dashboard.
+
+`seed_fleet` generates a reproducible fleet (users, plants, inverters and days of readings) with
+NumPy and bulk inserts, `replay_dashboard` replays a mix of the dashboard read endpoints against a
+running server and reports the throughput and latency percentiles of every endpoint. The results are
+saved as JSON, with the commit they were measured on, to be compared across commits.
+"""
+import datetime
+import random
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .alarms import rebuild_alarm_events
+from .constants import INVERTER_TYPE_SUNGROW, ALARM_STATUS_ONLINE, ALARM_NAME_OK
+from .models import Location, Device, InverterData, DeviceDailyRollup, AlarmEvent
+from .retention import update_rollups
+from ..accounts.models import User
+from ..base.utils.timezone import now_local
+
+SEED_BATCH_SIZE = 5000
+FAULT_STATUS = 'Fault'
+FAULT_NAME = 'Grid Overvoltage'
+# Minutes of the injected faults.
+FAULT_MINUTES = 30
+# Relative weights of the endpoints polled by the dashboard.
+DASHBOARD_MIX = {'account_overview': 1, 'user_locations': 2, 'location_devices': 3, 'de_vs_time': 4}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def get_fleet_email(prefix, number):
+    return '{}-{}@example.com'.format(prefix, number)
+
+
+def get_fleet_users(prefix):
+    return User.objects.filter(email__startswith='{}-'.format(prefix), email__endswith='@example.com')
+
+
+def get_fleet_devices(prefix):
+    return Device.objects.filter(imei__startswith='{}-'.format(prefix))
+
+
+@contextmanager
+def explicit_created_at():
+    """
+    Lets `bulk_create` keep the generated `created_at` of the readings, `auto_now_add` overrides it.
+    """
+    field = InverterData._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def generate_day(rng, day_start, interval, nominal_power, start_hour, end_hour, fault_rate):
+    """
+    Readings of one inverter day: a daylight power curve scaled by a random cloud cover, with an
+    occasional fault during which the inverter produces nothing.
+    Returns the timestamps (epoch seconds), power, cumulated energy and fault mask arrays.
+    """
+    offsets = np.arange(start_hour * 3600, end_hour * 3600, interval)
+    phase = (offsets - start_hour * 3600) / ((end_hour - start_hour) * 3600)
+    power = nominal_power * np.sin(np.pi * phase) * rng.uniform(0.5, 1.0) * rng.uniform(0.95, 1.05, len(offsets))
+    fault = np.zeros(len(offsets), dtype=bool)
+    if len(offsets) and rng.random() < fault_rate:
+        begin = int(rng.integers(0, len(offsets)))
+        fault[begin:begin + max(1, FAULT_MINUTES * 60 // interval)] = True
+        power[fault] = 0
+    energy = np.cumsum(power * interval / 3600)
+    return day_start.timestamp() + offsets, power, energy, fault
+
+
+def seed_fleet(prefix='loadtest', users=10, locations=3, devices=5, days=90, interval=None, start_hour=6,
+               end_hour=18, fault_rate=0.02, seed=0, batch_size=SEED_BATCH_SIZE, progress=None):
+    """
+    Creates `users` users owning `locations` plants of `devices` inverters each, with readings every
+    `interval` seconds (`TELEMETRY_INTERVAL_SECONDS`) over the last `days` days and today up to now,
+    then builds their rollups and alarm events. The same `seed` always generates the same fleet.
+    """
+    interval = interval or settings.TELEMETRY_INTERVAL_SECONDS
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    password = make_password(None)
+    User.objects.bulk_create([User(email=get_fleet_email(prefix, number), first_name='Load', last_name=str(number),
+                                   password=password) for number in range(users)])
+    fleet_users = list(get_fleet_users(prefix).order_by('id'))
+    Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in fleet_users])
+
+    Location.objects.bulk_create([
+        Location(name='{} plant {}-{}'.format(prefix, user.pk, number), inverter_type=INVERTER_TYPE_SUNGROW,
+                 capacity=str(devices * 50)) for user in fleet_users for number in range(locations)])
+    plants = list(Location.objects.filter(name__startswith='{} plant '.format(prefix)).order_by('id'))
+    Location.user.through.objects.bulk_create([
+        Location.user.through(location_id=plant.pk, user_id=fleet_users[index // locations].pk)
+        for index, plant in enumerate(plants)])
+    Device.objects.bulk_create([Device(device_name='INV-{}'.format(number + 1), location=plant,
+                                       imei='{}-{}-{}'.format(prefix, plant.pk, number))
+                                for plant in plants for number in range(devices)])
+    inverters = list(get_fleet_devices(prefix).order_by('id'))
+
+    now = timezone.now()
+    today = now_local(only_date=True)
+    first_day = today - datetime.timedelta(days=days)
+    readings, batch = 0, []
+    with explicit_created_at():
+        for inverter in inverters:
+            nominal_power = float(rng.uniform(10, 50))
+            total_energy = float(rng.uniform(1000, 100000))
+            for day_number in range(days + 1):
+                day = first_day + datetime.timedelta(days=day_number)
+                day_start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+                times, power, energy, fault = generate_day(rng, day_start, interval, nominal_power, start_hour,
+                                                           end_hour, fault_rate)
+                if day == today:
+                    past = times <= now.timestamp()
+                    times, power, energy, fault = times[past], power[past], energy[past], fault[past]
+                for created_at, op_active_power, daily_energy, faulty in zip(times.tolist(), power.tolist(),
+                                                                             energy.tolist(), fault.tolist()):
+                    batch.append(InverterData(
+                        device=inverter, imei=inverter.imei, sid='1', uid='1', rcnt='1',
+                        created_at=datetime.datetime.fromtimestamp(created_at, tz=datetime.timezone.utc),
+                        op_active_power=op_active_power, daily_energy=daily_energy,
+                        total_energy=total_energy + daily_energy, specific_yields=daily_energy / nominal_power,
+                        nominal_power=nominal_power, alarm_status=FAULT_STATUS if faulty else ALARM_STATUS_ONLINE,
+                        alarm_name=FAULT_NAME if faulty else ALARM_NAME_OK, alarm_ops_state='Run'))
+                total_energy += float(energy[-1]) if len(energy) else 0
+                if len(batch) >= batch_size:
+                    InverterData.objects.bulk_create(batch, batch_size=batch_size)
+                    readings += len(batch)
+                    batch = []
+                    if progress is not None:
+                        progress(readings)
+        if batch:
+            InverterData.objects.bulk_create(batch, batch_size=batch_size)
+            readings += len(batch)
+
+    Device.objects.filter(pk__in=[inverter.pk for inverter in inverters]).update(last_ingest_at=now, data_version=1)
+    rollups = update_rollups(from_date=first_day, to_date=today, device__in=inverters)
+    events = sum(rebuild_alarm_events(inverter) for inverter in inverters)
+    return {"users": len(fleet_users), "locations": len(plants), "devices": len(inverters), "readings": readings,
+            "rollups": rollups, "alarm_events": events, "seconds": round(time.perf_counter() - started, 1)}
+
+
+def clear_fleet(prefix='loadtest'):
+    """
+    Deletes a fleet created by `seed_fleet` with the same `prefix`.
+    """
+    devices = get_fleet_devices(prefix)
+    AlarmEvent.objects.filter(device__in=devices).delete()
+    DeviceDailyRollup.objects.filter(device__in=devices).delete()
+    readings = InverterData.objects.filter(device__in=devices).delete()[0]
+    devices.delete()
+    Location.objects.filter(name__startswith='{} plant '.format(prefix)).delete()
+    users = get_fleet_users(prefix)
+    Token.objects.filter(user__in=users).delete()
+    return {"users": users.delete()[0], "readings": readings}
+
+
+def get_replay_targets(prefix='loadtest'):
+    """
+    Token, plants and inverters of every user of the fleet.
+    """
+    targets = []
+    for token in Token.objects.filter(user__in=get_fleet_users(prefix)).order_by('user_id'):
+        location_ids = list(Location.objects.filter(user=token.user_id, is_active=True).values_list('id', flat=True))
+        device_ids = list(Device.objects.filter(location__in=location_ids, is_active=True).values_list('id', flat=True))
+        if location_ids and device_ids:
+            targets.append({"token": token.key, "locations": location_ids, "devices": device_ids})
+    return targets
+
+
+def get_dashboard_path(name, target, rng, today):
+    if name == 'account_overview':
+        return '/api/v1/location/account_overview/'
+    if name == 'user_locations':
+        return '/api/v1/location/user_locations/'
+    if name == 'location_devices':
+        return '/api/v1/device/location_devices/?location={}&start_date={}&end_date={}'.format(
+            rng.choice(target['locations']), today, today)
+    if name == 'de_vs_time':
+        return '/api/v1/location/de_vs_time/?device={}&from_date={}&to_date={}'.format(
+            rng.choice(target['devices']), today, today)
+    raise ValueError("Unknown dashboard endpoint {}.".format(name))
+
+
+def summarize(samples, elapsed):
+    """
+    Throughput, errors and latency percentiles (milliseconds) of `(status, seconds)` samples.
+    """
+    statuses = np.array([status for status, latency in samples], dtype=np.int32)
+    latencies = np.array([latency for status, latency in samples], dtype=np.float64) * 1000
+    summary = {"requests": len(samples), "errors": int(((statuses == 0) | (statuses >= 400)).sum()),
+               "throughput": round(len(samples) / elapsed, 2) if elapsed else 0}
+    if len(samples):
+        summary.update({"mean_ms": round(float(latencies.mean()), 2), "max_ms": round(float(latencies.max()), 2)})
+        summary.update({"p{}_ms".format(percentile): round(float(value), 2) for percentile, value in
+                        zip(PERCENTILES, np.percentile(latencies, PERCENTILES))})
+    return summary
+
+
+def replay_dashboard(url, targets, mix=None, concurrency=8, duration=60, warmup=5, seed=0, timeout=30):
+    """
+    Replays the dashboard traffic of the `targets` users against the server at `url` from
+    `concurrency` threads for `duration` seconds after `warmup` seconds, and returns the summary of
+    every endpoint and of the whole run.
+    """
+    mix = mix or DASHBOARD_MIX
+    names, weights = list(mix), list(mix.values())
+    today = now_local(only_date=True)
+    results = [[] for worker in range(concurrency)]
+    started = time.perf_counter()
+    measured_from, deadline = started + warmup, started + warmup + duration
+
+    def work(worker):
+        rng = random.Random(seed * 1000 + worker)
+        session = requests.Session()
+        while True:
+            target = rng.choice(targets)
+            name = rng.choices(names, weights)[0]
+            path = get_dashboard_path(name, target, rng, today)
+            request_started = time.perf_counter()
+            if request_started >= deadline:
+                return
+            try:
+                status = session.get(url.rstrip('/') + path, timeout=timeout,
+                                     headers={'Authorization': 'Token {}'.format(target['token'])}).status_code
+            except requests.RequestException:
+                status = 0
+            if request_started >= measured_from:
+                results[worker].append((name, status, time.perf_counter() - request_started))
+
+    threads = [threading.Thread(target=work, args=(worker,), daemon=True) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measured_from
+    samples = [sample for worker_results in results for sample in worker_results]
+    endpoints = {name: summarize([(status, latency) for sample_name, status, latency in samples
+                                  if sample_name == name], elapsed) for name in names}
+    return {"total": summarize([(status, latency) for name, status, latency in samples], elapsed),
+            "endpoints": endpoints, "seconds": round(elapsed, 1)}
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
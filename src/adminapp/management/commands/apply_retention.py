@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ...retention import RETENTION_CHUNK_SIZE, apply_retention, get_retention_policies, update_rollups
+
+
+class Command(BaseCommand):
+    help = "Rolls up the closed days, then archives and deletes the expired raw telemetry."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only count the expired rows.")
+        parser.add_argument('--no-archive', action='store_true', help="Delete without writing archives.")
+        parser.add_argument('--chunk-size', type=int, default=RETENTION_CHUNK_SIZE, help="Rows per transaction.")
+        parser.add_argument('--rollup-from', help="Rebuild the rollups from this date (YYYY-MM-DD) first.")
+        parser.add_argument('--policy', action='append', help="Only apply these policies (repeatable).")
+
+    def handle(self, *args, **options):
+        if options['rollup_from'] and not options['dry_run']:
+            count = update_rollups(from_date=options['rollup_from'])
+            self.stdout.write("Rebuilt {} rollups from {}.".format(count, options['rollup_from']))
+        policies = [policy for policy in get_retention_policies()
+                    if not options['policy'] or policy.name in options['policy']]
+        report = apply_retention(archive=not options['no_archive'], dry_run=options['dry_run'],
+                                 chunk_size=options['chunk_size'], policies=policies)
+        self.stdout.write("{} rollups written.".format(report['rollups']))
+        for result in report['policies']:
+            self.stdout.write("{policy:<20} {rows:>10} rows {bytes:>14} bytes  archive: {archive} "
+                              "({archive_bytes} bytes)".format(**result))
+        verb = "would be reclaimed" if options['dry_run'] else "reclaimed"
+        self.stdout.write("{} rows, about {} bytes {}.".format(report['rows'], report['bytes'], verb))
@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.utils.encoders import JSONEncoder
+
+from ...models import InverterData
+from ...serializers import InverterDataSerializer, InverterDataFlatSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares the nested InverterDataSerializer with the flat fast path on the latest readings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help="Rows per page.")
+        parser.add_argument('--repeat', type=int, default=20, help="Number of pages serialized per serializer.")
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        queryset = InverterData.objects.filter(is_active=True).order_by('-created_at', '-id')
+        if not queryset.exists():
+            self.stderr.write("No InverterData rows to benchmark.")
+            return
+
+        def nested():
+            return InverterDataSerializer(queryset[:rows], many=True).data
+
+        def flat():
+            serializer = InverterDataFlatSerializer(list(InverterDataFlatSerializer.get_queryset(queryset)[:rows]))
+            return {"results": serializer.data, "included": serializer.get_included()}
+
+        results = {}
+        for name, serialize in (('nested', nested), ('flat', flat)):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for i in range(repeat):
+                    payload = json.dumps(serialize(), cls=JSONEncoder)
+                elapsed = time.perf_counter() - started
+            results[name] = {
+                "rows_per_second": round(rows * repeat / elapsed, 1),
+                "ms_per_page": round(elapsed * 1000 / repeat, 2),
+                "queries_per_page": len(queries) / repeat,
+                "payload_bytes": len(payload),
+            }
+            self.stdout.write("{:<8} {rows_per_second:>12} rows/s {ms_per_page:>9} ms/page "
+                              "{queries_per_page:>7} queries/page {payload_bytes:>9} bytes".format(name, **results[name]))
+        speedup = results['flat']['rows_per_second'] / results['nested']['rows_per_second']
+        self.stdout.write("flat is {:.1f}x faster".format(speedup))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...alarms import rebuild_alarm_events
+from ...models import Device
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the alarm events of the devices from their stored readings, keeping the older events."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, action='append', help="Only rebuild these devices (repeatable).")
+
+    def handle(self, *args, **options):
+        devices = Device.objects.order_by('id')
+        if options['device']:
+            devices = devices.filter(pk__in=options['device'])
+        total = 0
+        for device in devices.iterator():
+            count = rebuild_alarm_events(device)
+            total += count
+            self.stdout.write("{:<30} {:>8} events".format(device.device_name or device.imei, count))
+        self.stdout.write("{} alarm events written.".format(total))
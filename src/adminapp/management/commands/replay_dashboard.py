@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...loadtest import DASHBOARD_MIX, PERCENTILES, get_commit, get_replay_targets, replay_dashboard
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DASHBOARD_MIX:
+            raise CommandError("Unknown endpoint {}, expected one of {}.".format(name, ', '.join(DASHBOARD_MIX)))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = "Replays the dashboard traffic of a seeded fleet (seed_fleet) against a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server.")
+        parser.add_argument('--prefix', default='loadtest', help="Prefix of the seeded fleet.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients.")
+        parser.add_argument('--duration', type=float, default=60, help="Measured seconds.")
+        parser.add_argument('--warmup', type=float, default=5, help="Seconds of traffic before measuring.")
+        parser.add_argument('--mix', type=parse_mix, help="Endpoint weights, for ex. user_locations=2,de_vs_time=4.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+        parser.add_argument('--output', help="JSON file of the results.")
+
+    def handle(self, *args, **options):
+        targets = get_replay_targets(options['prefix'])
+        if not targets:
+            raise CommandError("No fleet with the prefix '{}', run seed_fleet first.".format(options['prefix']))
+        mix = options['mix'] or DASHBOARD_MIX
+        started_at = timezone.now()
+        results = replay_dashboard(options['url'], targets, mix=mix, concurrency=options['concurrency'],
+                                   duration=options['duration'], warmup=options['warmup'], seed=options['seed'])
+
+        columns = ''.join('{:>10}'.format('p{}'.format(percentile)) for percentile in PERCENTILES)
+        self.stdout.write("{:<18}{:>10}{:>8}{:>10}{}{:>10}".format('endpoint', 'requests', 'errors', 'req/s',
+                                                                 columns, 'max'))
+        for name, summary in list(results['endpoints'].items()) + [('total', results['total'])]:
+            values = ''.join('{:>10}'.format(summary.get('p{}_ms'.format(percentile), '-'))
+                             for percentile in PERCENTILES)
+            self.stdout.write("{:<18}{:>10}{:>8}{:>10}{}{:>10}".format(
+                name, summary['requests'], summary['errors'], summary['throughput'], values,
+                summary.get('max_ms', '-')))
+
+        output = options['output'] or 'loadtest-{}.json'.format(started_at.strftime('%Y%m%d-%H%M%S'))
+        with open(output, 'w') as output_file:
+            json.dump({"commit": get_commit(), "started_at": started_at.isoformat(), "url": options['url'],
+                       "concurrency": options['concurrency'], "duration": options['duration'],
+                       "warmup": options['warmup'], "seed": options['seed'], "mix": mix, "users": len(targets),
+                       "results": results}, output_file, indent=2)
+        self.stdout.write("Results saved to {}.".format(output))
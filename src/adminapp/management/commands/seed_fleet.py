@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from ...loadtest import SEED_BATCH_SIZE, clear_fleet, get_fleet_users, seed_fleet
+
+
+class Command(BaseCommand):
+    help = "Seeds a reproducible load testing fleet: users, plants, inverters and days of readings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='loadtest', help="Prefix of the fleet users, plants and inverters.")
+        parser.add_argument('--users', type=int, default=10, help="Number of users.")
+        parser.add_argument('--locations', type=int, default=3, help="Plants per user.")
+        parser.add_argument('--devices', type=int, default=5, help="Inverters per plant.")
+        parser.add_argument('--days', type=int, default=90, help="Days of readings before today.")
+        parser.add_argument('--interval', type=int, help="Seconds between two readings.")
+        parser.add_argument('--fault-rate', type=float, default=0.02, help="Probability of a fault per inverter day.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE, help="Rows per insert.")
+        parser.add_argument('--clear', action='store_true', help="Delete the fleet with the same prefix first.")
+        parser.add_argument('--clear-only', action='store_true', help="Only delete the fleet with the same prefix.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear'] or options['clear_only']:
+            report = clear_fleet(prefix)
+            self.stdout.write("Deleted {users} users and {readings} readings.".format(**report))
+            if options['clear_only']:
+                return
+        if get_fleet_users(prefix).exists():
+            self.stderr.write("A fleet with the prefix '{}' exists, use --clear to replace it.".format(prefix))
+            return
+        report = seed_fleet(prefix=prefix, users=options['users'], locations=options['locations'],
+                            devices=options['devices'], days=options['days'], interval=options['interval'],
+                            fault_rate=options['fault_rate'], seed=options['seed'], batch_size=options['batch_size'],
+                            progress=lambda rows: self.stdout.write("{} readings written".format(rows), ending='\r'))
+        self.stdout.write("Seeded {users} users, {locations} plants, {devices} inverters, {readings} readings, "
+                          "{rollups} rollups and {alarm_events} alarm events in {seconds} s.".format(**report))
@@ -0,0 +1,42 @@
+"""
+Metrics of the telemetry ingest and of the report generation (see `src/base/metrics.py`).
+"""
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+from .constants import REPORT_STATUS_SUCCESS, REPORT_STATUS_ERROR, REPORT_STATUS_CANCELLED
+from .models import ZipReport
+from ..base.metrics import registry
+
+INGEST_FRAMES = registry.counter('surya_ingest_frames_total', 'Telemetry frames received.')
+INGEST_REJECTS = registry.counter('surya_ingest_rejects_total', 'Telemetry frames rejected, by reason.',
+                                  ['reason'])
+INGEST_DECODE_LATENCY = registry.histogram('surya_ingest_decode_seconds',
+                                           'Register decoding time of a frame, by inverter type.',
+                                           ['inverter_type'], buckets=(.0001, .00025, .0005, .001, .0025, .005,
+                                                                       .01, .025, .05, .1))
+INGEST_STORED = registry.counter('surya_ingest_stored_total', 'Readings stored, by inverter type.',
+                                 ['inverter_type'])
+
+
+@registry.register_collector
+def report_metrics():
+    """
+    Totals of the finished reports. `generate_zip` runs in the Celery workers, the reports it stores
+    are the values shared with the web processes.
+    """
+    duration = ExpressionWrapper(F('progress_updated_at') - F('created_at'), output_field=DurationField())
+    reports = ZipReport.objects.filter(
+        status__in=[REPORT_STATUS_SUCCESS, REPORT_STATUS_ERROR, REPORT_STATUS_CANCELLED],
+        progress_updated_at__isnull=False).values('status', 'file_format').annotate(
+        count=Count('id'), rows=Sum('rows_written'), duration=Sum(duration)).order_by('status', 'file_format')
+    counts, rows, seconds = [], [], []
+    for report in reports:
+        labels = {'status': report['status'], 'format': report['file_format']}
+        counts.append((labels, report['count']))
+        rows.append((labels, report['rows'] or 0))
+        seconds.append((labels, report['duration'].total_seconds() if report['duration'] else 0.0))
+    return [
+        ('surya_reports_total', 'counter', 'Reports generated, by final status and format.', counts),
+        ('surya_report_rows_total', 'counter', 'Rows written by the generated reports.', rows),
+        ('surya_report_duration_seconds_total', 'counter', 'Generation time of the reports.', seconds),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0017_rename_normal_power_inverterdata_nominal_power_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zipreport',
+            name='file_format',
+            field=models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('parquet', 'Parquet'), ('feather', 'Feather')], default='xlsx', max_length=16),
+        ),
+    ]
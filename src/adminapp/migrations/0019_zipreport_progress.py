@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0018_zipreport_file_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zipreport',
+            name='bytes_written',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='locations_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='locations_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='progress_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='rows_written',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
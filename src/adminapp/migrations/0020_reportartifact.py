@@ -0,0 +1,40 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0019_zipreport_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('from_date', models.DateField()),
+                ('to_date', models.DateField()),
+                ('frequency', models.CharField(blank=True, default='', max_length=128, null=True)),
+                ('file_format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('parquet', 'Parquet'), ('feather', 'Feather')], default='xlsx', max_length=16)),
+                ('data_checksum', models.CharField(max_length=64)),
+                ('path', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='adminapp.location')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='zipreport',
+            name='artifacts',
+            field=models.ManyToManyField(blank=True, to='adminapp.reportartifact'),
+        ),
+    ]
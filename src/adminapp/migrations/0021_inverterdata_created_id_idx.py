@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0020_reportartifact'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inverterdata',
+            index=models.Index(fields=['created_at', 'id'], name='inverterdata_created_id_idx'),
+        ),
+    ]
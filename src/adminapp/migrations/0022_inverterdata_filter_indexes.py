@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0021_inverterdata_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inverterdata',
+            index=models.Index(fields=['device', 'created_at'], name='inverterdata_device_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inverterdata',
+            index=models.Index(fields=['alarm_status', 'created_at'], name='inverterdata_alarm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inverterdata',
+            index=models.Index(fields=['daily_energy'], name='inverterdata_energy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inverterdata',
+            index=models.Index(fields=['op_active_power'], name='inverterdata_oap_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0022_inverterdata_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='last_ingest_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='last_ingest_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
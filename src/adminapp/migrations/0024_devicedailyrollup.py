@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0023_ingest_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified')),
+                ('date', models.DateField()),
+                ('readings', models.PositiveIntegerField(default=0)),
+                ('first_reading_at', models.DateTimeField(blank=True, null=True)),
+                ('last_reading_at', models.DateTimeField(blank=True, null=True)),
+                ('daily_energy', models.FloatField(blank=True, null=True)),
+                ('total_energy', models.FloatField(blank=True, null=True)),
+                ('op_active_power_max', models.FloatField(blank=True, null=True)),
+                ('op_active_power_avg', models.FloatField(blank=True, null=True)),
+                ('specific_yields', models.FloatField(blank=True, null=True)),
+                ('nominal_power', models.FloatField(blank=True, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='adminapp.device')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='devicedailyrollup',
+            index=models.Index(fields=['date'], name='rollup_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='devicedailyrollup',
+            unique_together={('device', 'date')},
+        ),
+    ]
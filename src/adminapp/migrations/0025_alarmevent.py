@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-19 16:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0024_devicedailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlarmEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified')),
+                ('code', models.CharField(blank=True, default='', max_length=128)),
+                ('state', models.CharField(blank=True, default='', max_length=128)),
+                ('ops_state', models.CharField(blank=True, default='', max_length=128)),
+                ('is_alarm', models.BooleanField(default=False)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='adminapp.device')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='alarmevent',
+            index=models.Index(fields=['device', 'ended_at'], name='alarmevent_device_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alarmevent',
+            index=models.Index(fields=['device', 'started_at'], name='alarmevent_device_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alarmevent',
+            index=models.Index(fields=['is_alarm', 'ended_at'], name='alarmevent_active_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0025_alarmevent'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='location',
+            name='data_version',
+        ),
+        migrations.RemoveField(
+            model_name='location',
+            name='last_ingest_at',
+        ),
+    ]
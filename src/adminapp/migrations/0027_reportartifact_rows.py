@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0026_remove_location_ingest_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportartifact',
+            name='rows',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
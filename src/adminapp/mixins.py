@@ -0,0 +1,38 @@
+from rest_framework import exceptions
+
+from .services import get_user_location_ids
+
+
+class LocationScopeMixin(object):
+    """
+    Row level filtering of a viewset queryset to the locations the requesting user is assigned to.
+
+    `location_scope_field` is the lookup of the location from the queryset model (`id` for
+    locations, `location` for devices, ...). The location ids are resolved once per request
+    (`get_user_location_ids`) and applied as an `IN` list, superusers are not filtered.
+    """
+    location_scope_field = 'location'
+
+    def get_location_ids(self):
+        if not hasattr(self, '_location_ids'):
+            self._location_ids = get_user_location_ids(self.request.user)
+        return self._location_ids
+
+    def is_location_scoped(self):
+        return not self.request.user.is_superuser
+
+    def filter_location_scope(self, queryset, field=None):
+        field = field or self.location_scope_field
+        if field is None or not self.is_location_scoped():
+            return queryset
+        return queryset.filter(**{'{}__in'.format(field): self.get_location_ids()})
+
+    def check_location_scope(self, location_ids):
+        """
+        Raises `PermissionDenied` if any of `location_ids` is out of the scope of the user.
+        """
+        if self.is_location_scoped() and not set(location_ids).issubset(self.get_location_ids()):
+            raise exceptions.PermissionDenied(detail="You do not have access to this location.")
+
+    def get_queryset(self):
+        return self.filter_location_scope(super(LocationScopeMixin, self).get_queryset())
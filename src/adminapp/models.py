@@ -1,6 +1,7 @@
 from django.db import models
 import jsonfield
 
+from .constants import REPORT_FORMAT_CHOICES, REPORT_FORMAT_XLSX
 from ..accounts.models import User
 from ..base.models import TimeStampedModel, BaseModel
 from ..base.validators.form_validations import file_extension_validator
@@ -28,6 +29,9 @@ class Device(TimeStampedModel):
     location = models.ForeignKey(Location, blank=True, null=True, on_delete=models.PROTECT)
     is_suspended = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # Bumped by the ingest view for every stored reading, used as cache validator.
+    data_version = models.PositiveBigIntegerField(default=0)
+    last_ingest_at = models.DateTimeField(blank=True, null=True)
 
 
 class InverterJsonData(BaseModel):
@@ -57,6 +61,74 @@ class InverterData(BaseModel):
     # meter_active_energy = models.CharField(max_length=128, blank=True, null=True, default='')
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='inverterdata_created_id_idx'),
+            models.Index(fields=['device', 'created_at'], name='inverterdata_device_idx'),
+            models.Index(fields=['alarm_status', 'created_at'], name='inverterdata_alarm_idx'),
+            models.Index(fields=['daily_energy'], name='inverterdata_energy_idx'),
+            models.Index(fields=['op_active_power'], name='inverterdata_oap_idx'),
+        ]
+
+
+class AlarmEvent(BaseModel):
+    """
+    A span of readings of a device with the same alarm state, from the first reading in that state
+    (`started_at`) to the first reading in the next one (`ended_at`, empty while the span is open).
+    """
+    device = models.ForeignKey(Device, on_delete=models.PROTECT)
+    code = models.CharField(max_length=128, blank=True, default='')
+    state = models.CharField(max_length=128, blank=True, default='')
+    ops_state = models.CharField(max_length=128, blank=True, default='')
+    is_alarm = models.BooleanField(default=False)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['device', 'ended_at'], name='alarmevent_device_open_idx'),
+            models.Index(fields=['device', 'started_at'], name='alarmevent_device_idx'),
+            models.Index(fields=['is_alarm', 'ended_at'], name='alarmevent_active_idx'),
+        ]
+
+
+class DeviceDailyRollup(BaseModel):
+    """
+    Daily aggregates of the active readings of a device, kept after the raw readings expire.
+    """
+    device = models.ForeignKey(Device, on_delete=models.PROTECT)
+    date = models.DateField()
+    readings = models.PositiveIntegerField(default=0)
+    first_reading_at = models.DateTimeField(blank=True, null=True)
+    last_reading_at = models.DateTimeField(blank=True, null=True)
+    daily_energy = models.FloatField(blank=True, null=True)
+    total_energy = models.FloatField(blank=True, null=True)
+    op_active_power_max = models.FloatField(blank=True, null=True)
+    op_active_power_avg = models.FloatField(blank=True, null=True)
+    specific_yields = models.FloatField(blank=True, null=True)
+    nominal_power = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('device', 'date')
+        indexes = [
+            models.Index(fields=['date'], name='rollup_date_idx'),
+        ]
+
+
+class ReportArtifact(BaseModel):
+    key = models.CharField(max_length=64, unique=True)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE)
+    from_date = models.DateField()
+    to_date = models.DateField()
+    frequency = models.CharField(max_length=128, blank=True, null=True, default='')
+    file_format = models.CharField(max_length=16, choices=REPORT_FORMAT_CHOICES, default=REPORT_FORMAT_XLSX)
+    data_checksum = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    # Rows of the plant analysis, added to the progress of the reports reusing the artifact.
+    rows = models.BigIntegerField(default=0)
+    last_used_at = models.DateTimeField(db_index=True)
+
 
 class ZipReport(BaseModel):
     user = models.ForeignKey(User, on_delete=models.PROTECT)
@@ -65,8 +137,16 @@ class ZipReport(BaseModel):
     to_date = models.DateTimeField(blank=True, null=True)
     frequency = models.CharField(max_length=128, blank=True, null=True, default='')
     category = models.CharField(max_length=128, blank=True, null=True, default='')
+    file_format = models.CharField(max_length=16, choices=REPORT_FORMAT_CHOICES, default=REPORT_FORMAT_XLSX)
     status = models.CharField(max_length=128, blank=True, null=True, default='')
+    locations_total = models.PositiveIntegerField(default=0)
+    locations_done = models.PositiveIntegerField(default=0)
+    rows_written = models.BigIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    progress_updated_at = models.DateTimeField(blank=True, null=True)
+    cancel_requested = models.BooleanField(default=False)
     zip_file = models.FileField(upload_to="reports/%Y/%m/%d", max_length=80, blank=True, null=True,
                                 validators=[file_extension_validator])
     location = models.ManyToManyField(Location, blank=True)
+    artifacts = models.ManyToManyField(ReportArtifact, blank=True)
     is_active = models.BooleanField(default=True)
@@ -15,6 +15,11 @@ class LocationPermissions(ResourcePermission):
     user_locations_perms = AdminPerm() | UserPerm()
     de_vs_time_perms = AdminPerm() | UserPerm()
     oap_vs_time_perms = AdminPerm() | UserPerm()
+    fleet_overview_perms = AdminPerm()
+    location_list_query_budget = 6
+    account_overview_query_budget = 7
+    user_locations_query_budget = 8
+    fleet_overview_query_budget = 8
 
 
 class DevicePermissions(ResourcePermission):
@@ -28,6 +33,13 @@ class DevicePermissions(ResourcePermission):
     list_perms = AdminPerm() | UserPerm()
     partial_update_perms = AdminPerm() | UserPerm()
     location_devices_perms = AdminPerm() | UserPerm()
+    downtime_perms = AdminPerm() | UserPerm()
+    inverter_summary_perms = AdminPerm() | UserPerm()
+    list_query_budget = 5
+    retrieve_query_budget = 5
+    downtime_query_budget = 6
+    inverter_summary_query_budget = 5
+    location_devices_query_budget = 7
 
 
 class InverterDataPermissions(ResourcePermission):
@@ -42,6 +54,9 @@ class InverterDataPermissions(ResourcePermission):
     partial_update_perms = AdminPerm()
     location_devices_perms = AdminPerm() | UserPerm()
     inverter_data_perms = AllowAny()
+    list_query_budget = 5
+    inverter_data_query_budget = 12
+    location_devices_query_budget = 5
 
 
 class ZipReportPermissions(ResourcePermission):
@@ -54,3 +69,16 @@ class ZipReportPermissions(ResourcePermission):
     update_perms = AdminPerm() | UserPerm()
     list_perms = AdminPerm() | UserPerm()
     report_zip_perms = AdminPerm() | UserPerm()
+    cancel_perms = AdminPerm() | UserPerm()
+    list_query_budget = 4
+
+
+class AlarmEventPermissions(ResourcePermission):
+    metadata_perms = AllowAny()
+    enough_perms = None
+    global_perms = None
+    retrieve_perms = AdminPerm() | UserPerm()
+    list_perms = AdminPerm() | UserPerm()
+    active_perms = AdminPerm() | UserPerm()
+    list_query_budget = 5
+    active_query_budget = 5
@@ -0,0 +1,132 @@
+"""
+Content addressed cache of the per location report files.
+
+An artifact is the set of files written for one location over a closed date range. It is keyed by
+(location, range, frequency, format) and stores a checksum of the readings of the range, so it is only
+reused while no reading of the range has been added, changed or removed. The key also covers the last
+edit of the location (`modified_at`), whose details are printed in the summary sheet.
+"""
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ReportArtifact
+from .reports import get_location_queryset, get_report_writer, write_location_report
+from ..base.utils.timezone import now_local
+
+# Bump when the content of the report files changes, so that older artifacts are not reused.
+REPORT_CACHE_VERSION = 5
+
+
+def get_artifact_key(location, from_date, to_date, frequency, file_format):
+    raw_key = "|".join(str(value) for value in (REPORT_CACHE_VERSION, location.id, location.modified_at.isoformat(),
+                                                 from_date, to_date, frequency or '', file_format))
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+def get_data_checksum(location, from_date, to_date):
+    """
+    Per day checksum of the readings of a location, computed with a single grouped query. The value sums
+    catch rows edited with `QuerySet.update()`, which does not touch `modified_at`.
+    """
+    days = get_location_queryset(location, from_date, to_date).annotate(day=TruncDate('created_at')).values(
+        'day').annotate(count=Count('id'), last_id=Max('id'), last_modified=Max('modified_at'),
+                        daily_energy=Sum('daily_energy'), total_energy=Sum('total_energy'),
+                        op_active_power=Sum('op_active_power')).order_by('day')
+    checksum = hashlib.sha256()
+    for day in days:
+        checksum.update("{day}:{count}:{last_id}:{last_modified}:{daily_energy}:{total_energy}:{op_active_power}\n"
+                        .format(**day).encode('utf-8'))
+    return checksum.hexdigest()
+
+
+def is_range_closed(to_date):
+    return datetime.date.fromisoformat(str(to_date)) < now_local(only_date=True)
+
+
+def link_artifact(artifact, directory):
+    """
+    Hard links the files of `artifact` into the report `directory`, copying them when the file
+    system does not support links. Returns the linked paths.
+    """
+    files = []
+    for source in sorted(Path(settings.MEDIA_ROOT, artifact.path).iterdir()):
+        target = Path(directory) / source.name
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        files.append(target)
+    return files
+
+
+def get_cached_artifact(location, from_date, to_date, frequency, file_format):
+    artifact = ReportArtifact.objects.filter(
+        key=get_artifact_key(location, from_date, to_date, frequency, file_format)).first()
+    if artifact is None:
+        return None
+    if not Path(settings.MEDIA_ROOT, artifact.path).is_dir() or \
+            artifact.data_checksum != get_data_checksum(location, from_date, to_date):
+        return None
+    ReportArtifact.objects.filter(pk=artifact.pk).update(last_used_at=timezone.now())
+    return artifact
+
+
+def store_artifact(location, from_date, to_date, frequency, file_format, progress=None):
+    """
+    Writes the report of `location` into the cache and returns the new artifact.
+    """
+    key = get_artifact_key(location, from_date, to_date, frequency, file_format)
+    checksum = get_data_checksum(location, from_date, to_date)
+    cache_root = Path(settings.REPORT_CACHE_ROOT)
+    cache_root.mkdir(parents=True, exist_ok=True)
+    # Write into a private directory first, a concurrent job may be building the same artifact.
+    temp_directory = tempfile.mkdtemp(dir=cache_root)
+    try:
+        writer = get_report_writer(file_format, temp_directory, location.name)
+        files = write_location_report(writer, location, from_date, to_date, progress=progress)
+    except Exception:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        raise
+    size = sum(path.stat().st_size for path in files)
+    directory = cache_root / key
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(temp_directory, directory)
+    artifact, created = ReportArtifact.objects.update_or_create(key=key, defaults={
+        "location": location, "from_date": from_date, "to_date": to_date, "frequency": frequency or '',
+        "file_format": file_format, "data_checksum": checksum,
+        "path": os.path.relpath(directory, settings.MEDIA_ROOT), "size": size, "rows": writer.rows_written,
+        "last_used_at": timezone.now()})
+    evict_artifacts(keep=artifact.pk)
+    return artifact
+
+
+def evict_artifacts(max_bytes=None, keep=None):
+    """
+    Deletes the least recently used artifacts, except `keep`, until the cache fits in
+    `REPORT_CACHE_MAX_BYTES`. Reports keep their own links to the files, so evicting an artifact never
+    breaks a report.
+    """
+    max_bytes = settings.REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = ReportArtifact.objects.aggregate(total=Sum('size'))['total'] or 0
+    evicted = 0
+    artifacts = ReportArtifact.objects.exclude(pk=keep).order_by('last_used_at').only('id', 'path', 'size')
+    for artifact in artifacts.iterator():
+        if total <= max_bytes:
+            break
+        shutil.rmtree(Path(settings.MEDIA_ROOT, artifact.path), ignore_errors=True)
+        artifact.delete()
+        total -= artifact.size
+        evicted += 1
+    return evicted
@@ -0,0 +1,424 @@
+import csv
+import json
+import time
+
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .alarms import ALARM_ANALYSIS_HEADER, get_alarm_analysis_rows
+from .analysis import GRID_DOWNTIME_HEADER, get_grid_downtime_rows
+from .constants import REPORT_FORMAT_XLSX, REPORT_FORMAT_CSV, REPORT_FORMAT_PARQUET, REPORT_FORMAT_FEATHER
+from .models import InverterData, ZipReport
+from .summary import INVERTER_SUMMARY_HEADER, get_inverter_summary_rows
+from ..base.utils.timezone import localtime_array
+
+REPORT_CHUNK_SIZE = 5000
+# Minimum number of seconds between two progress writes of a running report.
+REPORT_PROGRESS_INTERVAL = 2
+
+PLANT_ANALYSIS_HEADER = ["Timestamp", "Daily Energy [ KWh ]", "Output Active Power [ KW ]",
+                         "Specific Yield [ KWh/kwp ]", "CUF [ % ]", "Performance Ratio [ % ]",
+                         "Total Energy [ kwh ]", "Solar Insolation [ KWh/m2 ]", "Solar Irradiation [ W/m2 ]"]
+
+# Column names used by the columnar formats, in the same order as `PLANT_ANALYSIS_HEADER`.
+PLANT_ANALYSIS_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us')),
+    ('daily_energy', pa.float64()),
+    ('op_active_power', pa.float64()),
+    ('specific_yields', pa.float64()),
+    ('cuf', pa.float64()),
+    ('pr', pa.float64()),
+    ('total_energy', pa.float64()),
+    ('insolation', pa.float64()),
+    ('irradiation', pa.float64()),
+])
+
+
+def get_report_directory(report_instance):
+    directory = Path(settings.MEDIA_ROOT) / str(report_instance.id)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def get_location_queryset(location, from_date, to_date):
+    return InverterData.objects.filter(device__location=location,
+                                       created_at__date__lte=to_date,
+                                       created_at__date__gte=from_date,
+                                       is_active=True)
+
+
+def get_plant_performance(oap, nominal_power, daily_energy):
+    """
+    Returns the (cuf, pr, insolation, irradiation) figures used by both report sheets.
+    """
+    irradiation = 0
+    insolation = 0
+    cuf = 0
+    pr = 0
+    if nominal_power != 0:
+        irradiation = (oap * 1361) / nominal_power
+        insolation = irradiation * 24
+        normal_irradiation = nominal_power * irradiation
+        cuf = (float(daily_energy) * 100) / (nominal_power * 24)
+        if normal_irradiation != 0:
+            pr = (oap * 1000 * 100) / normal_irradiation
+    return cuf, pr, insolation, irradiation
+
+
+def get_plant_summary(location, from_date, to_date):
+    """
+    Returns the last reading of the range together with the "Plant Summery" rows.
+    """
+    inverter_data = get_location_queryset(location, from_date, to_date).order_by('created_at').last()
+    if not inverter_data:
+        return None, [
+            ['Plant Name', location.name],
+            ['Date', from_date, to_date],
+            ['Description'],
+            ['Plant Capacity', "", "kWp"],
+            ['Plant Manager'],
+            ['Manager Phone'],
+            ['']]
+    oap = float(inverter_data.op_active_power) if inverter_data.op_active_power else 0
+    nominal_power = float(inverter_data.nominal_power) if inverter_data.nominal_power else 0
+    cuf, pr, insolation, irradiation = get_plant_performance(oap, nominal_power, inverter_data.daily_energy)
+    return inverter_data, [
+        ['Plant Name', location.name],
+        ['Date', from_date, to_date],
+        ['Description', location.address],
+        ['Plant Capacity', location.capacity, "kWp"],
+        ['Plant Manager', location.manager],
+        ['Manager Phone', location.phone],
+        [''],
+        ['Daily Energy', inverter_data.daily_energy, "kWh"],
+        ['Output Active Power', inverter_data.op_active_power, "kw"],
+        ['Specific Yield', inverter_data.specific_yields, "(KWh/kwp)"],
+        ['CUF', cuf, "%"],
+        ['Performance Ratio', pr, "%"],
+        ['Total Energy', inverter_data.total_energy, "kwh"],
+        ['Solar Insolation', insolation, "KWh/m2"],
+        ['Solar Irradiation', irradiation, "W/m2"],
+    ]
+
+
+def iter_plant_analysis(location, from_date, to_date, oap, chunk_size=REPORT_CHUNK_SIZE):
+    """
+    Yields the "Plant Analysis" rows of a location in chunks of `chunk_size`, reading plain tuples
+    from the database instead of model instances.
+    """
+    queryset = get_location_queryset(location, from_date, to_date).values_list(
+        'created_at', 'daily_energy', 'op_active_power', 'specific_yields', 'total_energy', 'nominal_power')
+    chunk = []
+    for created_at, daily_energy, op_active_power, specific_yields, total_energy, nominal_power in \
+            queryset.iterator(chunk_size=chunk_size):
+        nominal_power = float(nominal_power) if nominal_power else 0
+        cuf, pr, insolation, irradiation = get_plant_performance(oap, nominal_power, daily_energy)
+        chunk.append([created_at, daily_energy, op_active_power, specific_yields, cuf, pr, total_energy,
+                      insolation, irradiation])
+        if len(chunk) >= chunk_size:
+            yield localize_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield localize_chunk(chunk)
+
+
+def localize_chunk(chunk):
+    """
+    Converts the first column of the rows to naive local times, in one vectorized operation.
+    """
+    for row, created_at in zip(chunk, localtime_array([row[0] for row in chunk]).tolist()):
+        row[0] = created_at
+    return chunk
+
+
+class ReportWriter(object):
+    """
+    Base class for the per location report writers.
+
+    A writer receives the summary rows once and the analysis rows in chunks, `close` returns the
+    list of files written for the location.
+    """
+    extension = None
+
+    def __init__(self, directory, name):
+        self.directory = Path(directory)
+        self.name = name
+        self.path = self.directory / '{}.{}'.format(name, self.extension)
+        self.rows_written = 0
+
+    def write_summary(self, rows, **metadata):
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def write_message(self, rows):
+        """
+        Writes informational rows (ex: "No data for the selected range") in place of the analysis data.
+        """
+        pass
+
+    def write_sheet(self, title, header, rows):
+        """
+        Writes an additional table of the report (ex: "Alarm Analysis").
+        """
+        pass
+
+    def close(self):
+        return [self.path]
+
+    def abort(self):
+        """
+        Releases the open file handles without finishing the files.
+        """
+        pass
+
+    def get_size(self):
+        return self.path.stat().st_size if self.path.exists() else 0
+
+
+class XlsxReportWriter(ReportWriter):
+    extension = REPORT_FORMAT_XLSX
+
+    def __init__(self, directory, name):
+        super(XlsxReportWriter, self).__init__(directory, name)
+        self.workbook = Workbook(write_only=True)
+        self.summary_sheet = self.workbook.create_sheet("Plant Summery")
+        self.analysis_sheet = self.workbook.create_sheet("Plant Analysis")
+        # ws6 = wb.create_sheet("Help & Support")
+        self.analysis_sheet.append([self.get_header_cell(self.analysis_sheet, title)
+                                    for title in PLANT_ANALYSIS_HEADER])
+
+    def write_summary(self, rows, **metadata):
+        for row in rows:
+            self.summary_sheet.append(row)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.analysis_sheet.append(row)
+        self.rows_written += len(rows)
+
+    def write_message(self, rows):
+        for row in rows:
+            self.analysis_sheet.append(row)
+
+    def write_sheet(self, title, header, rows):
+        sheet = self.workbook.create_sheet(title)
+        sheet.append([self.get_header_cell(sheet, value) for value in header])
+        for row in rows:
+            sheet.append(row)
+
+    @staticmethod
+    def get_header_cell(sheet, value):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True, italic=True)
+        return cell
+
+    def close(self):
+        self.workbook.save(str(self.path))
+        return [self.path]
+
+    def abort(self):
+        self.workbook.close()
+
+
+class ColumnarReportWriter(ReportWriter):
+    """
+    Writers for the analyst friendly formats. The summary is stored in a JSON sidecar file next to
+    the data file, as these formats only hold a single table.
+    """
+
+    def __init__(self, directory, name):
+        super(ColumnarReportWriter, self).__init__(directory, name)
+        self.sidecar_path = self.directory / '{}.summary.json'.format(name)
+        self.metadata = {}
+
+    def write_summary(self, rows, **metadata):
+        # The "Date" row is already part of the metadata as from_date / to_date.
+        self.metadata = dict(metadata)
+        self.metadata['summary'] = [
+            {"label": row[0], "value": row[1] if len(row) > 1 else None, "unit": row[2] if len(row) > 2 else None}
+            for row in rows if row and row[0] and row[0] != 'Date']
+
+    def write_message(self, rows):
+        self.metadata['messages'] = [" ".join(str(value) for value in row) for row in rows]
+
+    def write_sheet(self, title, header, rows):
+        self.metadata.setdefault('sheets', {})[title] = {"columns": header, "rows": rows}
+
+    def close(self):
+        self.metadata['rows'] = self.rows_written
+        self.metadata['columns'] = PLANT_ANALYSIS_SCHEMA.names
+        with open(self.sidecar_path, 'w') as sidecar:
+            json.dump(self.metadata, sidecar, cls=DjangoJSONEncoder, indent=2)
+        return [self.path, self.sidecar_path]
+
+
+class CsvReportWriter(ColumnarReportWriter):
+    extension = REPORT_FORMAT_CSV
+
+    def __init__(self, directory, name):
+        super(CsvReportWriter, self).__init__(directory, name)
+        self.file = open(self.path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(PLANT_ANALYSIS_SCHEMA.names)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.rows_written += len(rows)
+
+    def close(self):
+        self.file.close()
+        return super(CsvReportWriter, self).close()
+
+    def abort(self):
+        self.file.close()
+
+
+class ArrowReportWriter(ColumnarReportWriter):
+    """
+    Converts every chunk to an Arrow record batch so that only one chunk is held in memory.
+    """
+
+    def __init__(self, directory, name):
+        super(ArrowReportWriter, self).__init__(directory, name)
+        self.writer = self.open_writer()
+
+    def open_writer(self):
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        frame = pd.DataFrame(rows, columns=PLANT_ANALYSIS_SCHEMA.names)
+        self.writer.write_table(pa.Table.from_pandas(frame, schema=PLANT_ANALYSIS_SCHEMA, preserve_index=False))
+        self.rows_written += len(rows)
+
+    def close(self):
+        self.writer.close()
+        return super(ArrowReportWriter, self).close()
+
+    def abort(self):
+        self.writer.close()
+
+
+class ParquetReportWriter(ArrowReportWriter):
+    extension = REPORT_FORMAT_PARQUET
+
+    def open_writer(self):
+        # Every chunk becomes a row group.
+        return pq.ParquetWriter(str(self.path), PLANT_ANALYSIS_SCHEMA, compression='snappy')
+
+
+class FeatherReportWriter(ArrowReportWriter):
+    extension = REPORT_FORMAT_FEATHER
+
+    def open_writer(self):
+        # Feather V2 is the Arrow IPC file format, which can be written batch by batch.
+        return pa.ipc.new_file(str(self.path), PLANT_ANALYSIS_SCHEMA,
+                               options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+
+REPORT_WRITERS = {
+    REPORT_FORMAT_XLSX: XlsxReportWriter,
+    REPORT_FORMAT_CSV: CsvReportWriter,
+    REPORT_FORMAT_PARQUET: ParquetReportWriter,
+    REPORT_FORMAT_FEATHER: FeatherReportWriter,
+}
+
+
+def get_report_writer(file_format, directory, name):
+    writer_class = REPORT_WRITERS.get(file_format or REPORT_FORMAT_XLSX)
+    if writer_class is None:
+        raise ValueError("Unsupported report format: {}".format(file_format))
+    return writer_class(directory, name)
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+class ReportProgress(object):
+    """
+    Keeps the progress counters of a running report and writes them with `update_fields`, at most once
+    every `interval` seconds. Every write also reads back `cancel_requested`, so a cancelled report
+    stops at the next chunk boundary.
+    """
+    fields = ('locations_total', 'locations_done', 'rows_written', 'bytes_written', 'progress_updated_at')
+
+    def __init__(self, report_instance, interval=REPORT_PROGRESS_INTERVAL):
+        self.report_instance = report_instance
+        self.interval = interval
+        self.last_flush = 0
+        self.location_bytes = 0
+
+    def start(self, locations_total, status):
+        report = self.report_instance
+        report.status = status
+        report.locations_total = locations_total
+        report.locations_done = report.rows_written = report.bytes_written = 0
+        self.flush(force=True, extra_fields=('status',))
+
+    def add_rows(self, count, writer=None):
+        self.report_instance.rows_written += count
+        if writer is not None:
+            self.report_instance.bytes_written = self.location_bytes + writer.get_size()
+        self.flush()
+
+    def location_done(self, files):
+        self.location_bytes += sum(path.stat().st_size for path in files if path.exists())
+        self.report_instance.bytes_written = self.location_bytes
+        self.report_instance.locations_done += 1
+        self.flush()
+
+    def finish(self, status):
+        self.report_instance.status = status
+        self.flush(force=True, extra_fields=('status',))
+
+    def flush(self, force=False, extra_fields=()):
+        if not force and time.monotonic() - self.last_flush < self.interval:
+            return
+        self.last_flush = time.monotonic()
+        self.report_instance.progress_updated_at = timezone.now()
+        self.report_instance.save(update_fields=self.fields + tuple(extra_fields) + ('modified_at',))
+        if not force and self.is_cancel_requested():
+            raise ReportCancelled()
+
+    def is_cancel_requested(self):
+        return ZipReport.objects.filter(pk=self.report_instance.pk, cancel_requested=True).exists()
+
+
+def write_location_report(writer, location, from_date, to_date, progress=None):
+    """
+    Runs the extraction pipeline of a single location through `writer` and returns the files written.
+    """
+    try:
+        inverter_data, summary_rows = get_plant_summary(location, from_date, to_date)
+        writer.write_summary(summary_rows, location=location.id, name=location.name, from_date=from_date,
+                             to_date=to_date)
+        if inverter_data:
+            oap = float(inverter_data.op_active_power) if inverter_data.op_active_power else 0
+            for chunk in iter_plant_analysis(location, from_date, to_date, oap):
+                writer.write_rows(chunk)
+                if progress is not None:
+                    progress.add_rows(len(chunk), writer)
+        else:
+            writer.write_message([['Error', "No data for the selected range"]])
+        writer.write_sheet("Grid Downtime Analysis", GRID_DOWNTIME_HEADER,
+                           get_grid_downtime_rows(location, from_date, to_date))
+        writer.write_sheet("Inverter Summery", INVERTER_SUMMARY_HEADER,
+                           get_inverter_summary_rows(location, from_date, to_date))
+        writer.write_sheet("Alarm Analysis", ALARM_ANALYSIS_HEADER,
+                           get_alarm_analysis_rows(location, from_date, to_date))
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
@@ -0,0 +1,158 @@
+"""
+Retention policy of the raw telemetry.
+
+Closed days are first rolled up per device into `DeviceDailyRollup`, which is kept forever. Raw
+rows older than their policy (and soft deleted rows, after a grace period) are then exported to
+gzipped JSON lines archives and deleted in small chunks, one transaction per chunk, so that the
+ingest is never blocked behind a long running delete.
+"""
+import datetime
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import InverterData, InverterJsonData, DeviceDailyRollup
+from ..base.utils.timezone import now_local
+
+RETENTION_CHUNK_SIZE = 2000
+
+
+class RetentionPolicy(object):
+    """
+    Raw rows of `model` older than `days` expire, as well as rows soft deleted (`is_active=False`)
+    more than `inactive_days` ago.
+    """
+
+    def __init__(self, name, model, days, inactive_days):
+        self.name = name
+        self.model = model
+        self.days = days
+        self.inactive_days = inactive_days
+
+    def get_cutoff(self, days, today=None):
+        """
+        Local midnight `days` days before today, so that only whole days expire.
+        """
+        today = today or now_local(only_date=True)
+        return timezone.make_aware(datetime.datetime.combine(today - datetime.timedelta(days=days),
+                                                             datetime.time.min))
+
+    def get_expired_queryset(self, today=None):
+        return self.model.objects.filter(
+            Q(created_at__lt=self.get_cutoff(self.days, today)) |
+            Q(is_active=False, modified_at__lt=self.get_cutoff(self.inactive_days, today)))
+
+
+def get_retention_policies():
+    return [
+        RetentionPolicy('inverter_data', InverterData, settings.RAW_TELEMETRY_RETENTION_DAYS,
+                        settings.INACTIVE_TELEMETRY_RETENTION_DAYS),
+        RetentionPolicy('inverter_json_data', InverterJsonData, settings.RAW_PAYLOAD_RETENTION_DAYS,
+                        settings.INACTIVE_TELEMETRY_RETENTION_DAYS),
+    ]
+
+
+def get_daily_aggregates(from_date, to_date, **filters):
+    """
+    Rollup values of the active readings per device and day, for the days in `[from_date, to_date)`.
+    """
+    return InverterData.objects.filter(
+        is_active=True, device__isnull=False, created_at__date__gte=from_date, created_at__date__lt=to_date,
+        **filters
+    ).annotate(date=TruncDate('created_at')).values('device', 'date').annotate(
+        readings=Count('id'), first_reading_at=Min('created_at'), last_reading_at=Max('created_at'),
+        daily_energy=Max('daily_energy'), total_energy=Max('total_energy'),
+        op_active_power_max=Max('op_active_power'), op_active_power_avg=Avg('op_active_power'),
+        specific_yields=Max('specific_yields'), nominal_power=Max('nominal_power')).order_by()
+
+
+def update_rollups(from_date=None, to_date=None, **filters):
+    """
+    (Re)builds the rollups of the days in `[from_date, to_date)`, by default from the last rolled up
+    day (or the first reading) up to today, which is still open. Only the (device, day) pairs which
+    still have raw readings are replaced, the rollups of the expired days are kept. `filters` restrict
+    the readings rolled up (ex: `device__in=devices`). Returns the number of rollups written.
+    """
+    to_date = to_date or now_local(only_date=True)
+    if from_date is None:
+        from_date = DeviceDailyRollup.objects.aggregate(date=Max('date'))['date']
+    if from_date is None:
+        first_reading = InverterData.objects.filter(is_active=True).aggregate(created_at=Min('created_at'))
+        if first_reading['created_at'] is None:
+            return 0
+        from_date = timezone.localtime(first_reading['created_at']).date()
+
+    days = get_daily_aggregates(from_date, to_date, **filters)
+    rollups = [DeviceDailyRollup(device_id=day.pop('device'), **day) for day in days]
+    devices_by_date = {}
+    for rollup in rollups:
+        devices_by_date.setdefault(rollup.date, []).append(rollup.device_id)
+    with transaction.atomic():
+        for date, device_ids in devices_by_date.items():
+            DeviceDailyRollup.objects.filter(date=date, device__in=device_ids).delete()
+        DeviceDailyRollup.objects.bulk_create(rollups, batch_size=RETENTION_CHUNK_SIZE)
+    return len(rollups)
+
+
+def get_archive_path(policy):
+    directory = os.path.join(settings.TELEMETRY_ARCHIVE_ROOT, policy.name)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, '{}-{}.jsonl.gz'.format(policy.name,
+                                                           timezone.localtime().strftime('%Y%m%d-%H%M%S')))
+
+
+def apply_policy(policy, archive=True, dry_run=False, chunk_size=RETENTION_CHUNK_SIZE, today=None):
+    """
+    Archives and deletes the expired rows of `policy`. Returns the rows deleted, their size as JSON
+    (an estimate of the reclaimed bytes, the database frees the pages on its next vacuum) and the
+    size of the archive.
+    """
+    queryset = policy.get_expired_queryset(today)
+    result = {"policy": policy.name, "rows": 0, "bytes": 0, "archive": None, "archive_bytes": 0}
+    if dry_run:
+        result["rows"] = queryset.count()
+        return result
+
+    archive_file = None
+    if archive and queryset.exists():
+        result["archive"] = get_archive_path(policy)
+        archive_file = gzip.open(result["archive"], 'at', encoding='utf-8')
+    try:
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id').values()[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            lines = ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            if archive_file is not None:
+                # The chunk is on disk before its rows are deleted.
+                archive_file.write(lines)
+                archive_file.flush()
+            with transaction.atomic():
+                policy.model.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            result["rows"] += len(rows)
+            result["bytes"] += len(lines.encode('utf-8'))
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+            result["archive_bytes"] = os.path.getsize(result["archive"])
+    return result
+
+
+def apply_retention(archive=True, dry_run=False, chunk_size=RETENTION_CHUNK_SIZE, policies=None):
+    """
+    Rolls up the closed days and applies every retention policy. Returns a report per policy.
+    """
+    rollups = 0 if dry_run else update_rollups()
+    results = [apply_policy(policy, archive=archive, dry_run=dry_run, chunk_size=chunk_size)
+               for policy in (policies or get_retention_policies())]
+    return {"rollups": rollups, "policies": results, "rows": sum(result["rows"] for result in results),
+            "bytes": sum(result["bytes"] for result in results)}
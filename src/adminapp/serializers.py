@@ -7,9 +7,11 @@ from openpyxl import Workbook
 from openpyxl.styles import Font
 
 from django.conf import settings
+from django.db.models import IntegerField, OuterRef, Subquery, Value
 from rest_framework import serializers
 
-from .models import Location, Device, InverterData, InverterJsonData, ZipReport
+from .constants import REPORT_FORMAT_XLSX
+from .models import Location, Device, InverterData, InverterJsonData, ZipReport, AlarmEvent
 from .tasks import generate_zip
 
 from ..accounts.serializers import UserSerializer
@@ -28,16 +30,19 @@ class LocationSerializer(ModelSerializer):
     class Meta:
         model = Location
         fields = '__all__'
+        embed_fields = {'user_data': ('user',)}
 
     def validate(self, data):
         return data
 
-    @staticmethod
-    def get_user_data(obj):
+    def get_user_data(self, obj):
+        # `user` is prefetched with the page and every user is serialized once per request
+        users = self.get_serializer_cache('users')
         user_data = []
-        queryset = obj.user.all() if obj.user else None
-        for user in queryset:
-            user_data.append(UserSerializer(user).data)
+        for user in obj.user.all():
+            if user.pk not in users:
+                users[user.pk] = UserSerializer(user).data
+            user_data.append(users[user.pk])
         return user_data
 
 
@@ -47,6 +52,8 @@ class DeviceSerializer(ModelSerializer):
     class Meta:
         model = Device
         fields = '__all__'
+        embed_fields = {'location_data': ('location', 'location__user')}
+        read_only_fields = ('data_version', 'last_ingest_at')
 
     def validate(self, attrs):
         is_active = attrs.get("is_active", True)
@@ -60,9 +67,8 @@ class DeviceSerializer(ModelSerializer):
                 raise serializers.ValidationError({"detail": "Please provide device IMEI number!"})
         return attrs
 
-    @staticmethod
-    def get_location_data(obj):
-        return LocationSerializer(obj.location).data if obj.location else None
+    def get_location_data(self, obj):
+        return LocationSerializer(obj.location, context=self.get_nested_context()).data if obj.location else None
 
 
 class InverterDataSerializer(ModelSerializer):
@@ -71,10 +77,77 @@ class InverterDataSerializer(ModelSerializer):
     class Meta:
         model = InverterData
         fields = '__all__'
+        embed_fields = {'device_data': ('device__location', 'device__location__user')}
 
-    @staticmethod
-    def get_device_data(obj):
-        return DeviceSerializer(obj.device).data if obj.device else None
+    def get_device_data(self, obj):
+        return DeviceSerializer(obj.device, context=self.get_nested_context()).data if obj.device else None
+
+
+class AlarmEventSerializer(ModelSerializer):
+    device_data = serializers.SerializerMethodField(required=False)
+
+    class Meta:
+        model = AlarmEvent
+        fields = '__all__'
+        embed_fields = {'device_data': ('device__location', 'device__location__user')}
+
+    def get_device_data(self, obj):
+        return DeviceSerializer(obj.device, context=self.get_nested_context()).data
+
+
+class InverterDataFlatSerializer(object):
+    """
+    Read only fast path for the paginated InverterData listings (`?shape=flat`).
+
+    Works on `values()` rows instead of model instances. Every row carries the device id only; the
+    devices and their locations are serialized once per page into the `included` dictionary, keyed
+    by id, with one query per model.
+    """
+    fields = ('id', 'device', 'imei', 'sid', 'uid', 'rcnt', 'daily_energy', 'total_energy', 'op_active_power',
+              'specific_yields', 'inverter_op_active_power', 'inverter_daily_energy', 'inverter_total_energy',
+              'meter_active_power', 'alarm_status', 'alarm_ops_state', 'alarm_name', 'nominal_power', 'alarm_date',
+              'is_active', 'created_at', 'modified_at')
+    datetime_fields = ('created_at', 'modified_at')
+    datetime_field = serializers.DateTimeField()
+    device_fields = ('id', 'device_name', 'imei', 'location', 'is_suspended', 'is_active', 'created_at')
+    location_fields = ('id', 'name', 'address', 'pincode', 'latitude', 'longitude', 'inverter_type', 'manager',
+                       'phone', 'capacity', 'is_suspended', 'is_active', 'created_at')
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def get_queryset(cls, queryset):
+        return queryset.values(*cls.fields)
+
+    @classmethod
+    def to_representation(cls, row, datetime_fields):
+        for field in datetime_fields:
+            if row.get(field) is not None:
+                row[field] = cls.datetime_field.to_representation(row[field])
+        return row
+
+    @property
+    def data(self):
+        if not hasattr(self, '_data'):
+            self._data = [self.to_representation(dict(row), self.datetime_fields) for row in self.instance]
+        return self._data
+
+    def get_included(self):
+        device_ids = set(row['device'] for row in self.data if row['device'] is not None)
+        devices = {}
+        for device in Device.objects.filter(id__in=device_ids).values(*self.device_fields):
+            devices[device['id']] = self.to_representation(device, ('created_at',))
+        location_ids = set(device['location'] for device in devices.values() if device['location'] is not None)
+        locations = {}
+        for location in Location.objects.filter(id__in=location_ids).values(*self.location_fields):
+            location['user'] = []
+            locations[location['id']] = self.to_representation(location, ('created_at',))
+        for location_id, user_id in Location.user.through.objects.filter(
+                location_id__in=location_ids).values_list('location_id', 'user_id'):
+            locations[location_id]['user'].append(user_id)
+        return {"devices": devices, "locations": locations}
 
 
 class ETodayInverterDataSerializer(ModelSerializer):
@@ -89,26 +162,64 @@ class ETodayInverterDataSerializer(ModelSerializer):
         return irradiation
 
 
-class LocationSummarySerializer(serializers.ModelSerializer):
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def reading_id_subquery(**filters):
+    """
+    Id of the last reading matching `filters` (which refer to the summarized row with `OuterRef`).
+    """
+    return Subquery(InverterData.objects.filter(**filters).order_by('-created_at', '-id').values('id')[:1])
+
+
+class SummaryReadingsMixin(object):
+    """
+    The summaries read the readings whose ids `optimize_queryset` annotates on the rows (the
+    `reading_annotations`). They are loaded for the whole page with one query, on the first summary.
+    """
+    reading_annotations = ()
+
+    def get_reading(self, obj, annotation):
+        reading_id = getattr(obj, annotation, None)
+        readings = self.get_serializer_cache('summary_readings')
+        if reading_id is not None and reading_id not in readings:
+            page = getattr(self.parent, 'instance', None)
+            if not isinstance(page, (list, tuple)):
+                page = [obj]
+            readings.update(InverterData.objects.in_bulk(
+                set(getattr(row, name, None) for row in page for name in self.reading_annotations) - {None}))
+        return readings.get(reading_id)
+
+
+class LocationSummarySerializer(SummaryReadingsMixin, ModelSerializer):
     summary = serializers.SerializerMethodField(required=False)
+    reading_annotations = ('summary_reading_id', 'last_reading_id')
 
     class Meta:
         model = Location
         fields = '__all__'
 
+    def optimize_queryset(self, queryset):
+        queryset = super(LocationSummarySerializer, self).optimize_queryset(queryset)
+        if 'summary' not in self.fields:
+            return queryset
+        date = parse_date(self.context.get('date'))
+        summary_reading_id = Value(None, output_field=IntegerField()) if date is None else reading_id_subquery(
+            device__location=OuterRef('pk'), created_at__date=date, is_active=True)
+        return queryset.annotate(summary_reading_id=summary_reading_id,
+                                 last_reading_id=reading_id_subquery(device__location=OuterRef('pk')))
+
     def get_summary(self, obj):
-        inverter_data = None
-        try:
-            inverter_data = InverterData.objects.filter(device__location=obj, created_at__date=self.context.get('date'),
-                                                        is_active=True).order_by('-id').first()
-        except:
-            pass
+        inverter_data = self.get_reading(obj, 'summary_reading_id')
         status = "Offline"
         alarm_status = "--"
         if obj:
-            device_data = InverterData.objects.filter(device__location=obj)
+            device_data = self.get_reading(obj, 'last_reading_id')
             if device_data:
-                device_data = device_data.order_by('created_at').last()
                 if localtime(device_data.created_at) + datetime.timedelta(minutes=5) > now_local():
                     status = "Online"
                     alarm_status = device_data.alarm_status
@@ -149,28 +260,31 @@ class LocationSummarySerializer(serializers.ModelSerializer):
             return context
 
 
-class DeviceSummarySerializer(serializers.ModelSerializer):
+class DeviceSummarySerializer(SummaryReadingsMixin, ModelSerializer):
     summary = serializers.SerializerMethodField(required=False)
+    reading_annotations = ('summary_reading_id', 'last_reading_id')
 
     class Meta:
         model = Device
         fields = '__all__'
 
+    def optimize_queryset(self, queryset):
+        queryset = super(DeviceSummarySerializer, self).optimize_queryset(queryset)
+        if 'summary' not in self.fields:
+            return queryset
+        return queryset.annotate(
+            summary_reading_id=reading_id_subquery(device=OuterRef('pk'), created_at__date__gte=self.context.get(
+                'start_date'), created_at__date__lte=self.context.get('end_date'), is_active=True),
+            last_reading_id=reading_id_subquery(device=OuterRef('pk')))
+
     def get_summary(self, obj):
-        instance = None
         status = "Offline"
-        if obj.imei:
-            instance = InverterData.objects.filter(device=obj)
-        if instance:
-            last_record = instance.order_by('created_at').last()
+        last_record = self.get_reading(obj, 'last_reading_id') if obj.imei else None
+        if last_record:
             if localtime(last_record.created_at) + datetime.timedelta(minutes=5) > now_local():
                 status = last_record.alarm_status
-        start_date = self.context.get('start_date')
-        end_date = self.context.get('end_date')
 
-        inverter_data = InverterData.objects.filter(device=obj, created_at__date__gte=start_date,
-                                                    created_at__date__lte=end_date,
-                                                    is_active=True).order_by('created_at').last()
+        inverter_data = self.get_reading(obj, 'summary_reading_id')
         context = {"total_energy": None,
                    "daily_energy": None,
                    "alarm_ops_state": None,
@@ -195,8 +309,11 @@ class ZipReportSerializer(serializers.ModelSerializer):
         model = ZipReport
 
         fields = (
-            'id', 'name', "from_date", "to_date", "frequency", "category", "status", "location", "zip_file",
-            "is_active")
+            'id', 'name', "from_date", "to_date", "frequency", "category", "file_format", "status", "location",
+            "zip_file", "is_active", "locations_total", "locations_done", "rows_written", "bytes_written",
+            "progress_updated_at", "cancel_requested")
+        read_only_fields = ("status", "locations_total", "locations_done", "rows_written", "bytes_written",
+                            "progress_updated_at", "cancel_requested")
 
     def create(self, validated_data):
         location_list = validated_data.pop("location", None)
@@ -205,13 +322,15 @@ class ZipReportSerializer(serializers.ModelSerializer):
         to_date = validated_data.pop("to_date", None)
         frequency = validated_data.pop("frequency", None)
         category = validated_data.pop("category", None)
+        file_format = validated_data.pop("file_format", REPORT_FORMAT_XLSX)
         name = validated_data.pop("name", None)
         locations = []
         for record in location_list:
             locations.append(record.id)
         report_instance = ZipReport.objects.create(user=user, from_date=from_date,
                                                    to_date=to_date,
-                                                   category=category, frequency=frequency, name=name)
+                                                   category=category, frequency=frequency, name=name,
+                                                   file_format=file_format)
         from_date = from_date.strftime("%Y-%m-%d")
         to_date = to_date.strftime("%Y-%m-%d")
         generate_zip.s(locations, report_instance.id, from_date, to_date).apply_async(countdown=5, serializer='json')
@@ -1,5 +1,26 @@
+import base64
+import datetime
 import zipfile
 
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import Count, F, Max, Q, Sum
+
+from .models import Location, Device
+from ..base.cache import bump_version
+from ..base.pubsub import get_pubsub
+from ..base.utils.timezone import now_local, localtime_array, epoch_ms_array
+
+# A device without readings for this long is reported as offline.
+ONLINE_WINDOW = datetime.timedelta(minutes=5)
+# Cache lifetime of the responses for date ranges which ended before today.
+PAST_RANGE_MAX_AGE = 24 * 60 * 60
+LOCATION_SCOPE_KEY = 'location-scope:{}'
+OFFLINE_CHECK_KEY = 'live:offline-checked-at'
+
 
 def zip_file(archive_list, zfilename):
     zout = zipfile.ZipFile(zfilename, "w", zipfile.ZIP_DEFLATED)
@@ -51,3 +72,246 @@ def alarm_name_check(value):
         return "OK"
     else:
         return "Device abnormal"
+
+
+def record_ingest(device, created_at):
+    """
+    Bumps the data version of the device after a reading has been stored, and invalidates the cached
+    actions depending on it. The location is not updated, the inverters of a plant would all contend
+    for its row: its validator is derived from its devices (`user_locations_version`).
+    """
+    Device.objects.filter(pk=device.pk).update(data_version=F('data_version') + 1, last_ingest_at=created_at)
+    bump_version('device', device.pk)
+    if device.location_id:
+        bump_version('location', device.location_id)
+
+
+def device_data_version(view, request):
+    """
+    Cache validator of the per device chart actions, based on the device data version.
+    """
+    today = now_local(only_date=True)
+    to_date = request.query_params.get('to_date', str(today))
+    device = None
+    try:
+        device = Device.objects.filter(pk=request.query_params.get('device')).values(
+            'data_version', 'last_ingest_at', 'modified_at').first()
+    except (TypeError, ValueError):
+        pass
+    if device is None:
+        return today, None, 0
+    last_modified = max(filter(None, (device['last_ingest_at'], device['modified_at'])))
+    max_age = PAST_RANGE_MAX_AGE if to_date < str(today) else 0
+    return (today, device['data_version'], device['modified_at']), last_modified, max_age
+
+
+def user_locations_version(view, request):
+    """
+    Cache validator of the per user dashboard actions. For every location of the user: its
+    modification time, and the summed data versions, number, last modification and last reading of
+    its active devices, from which the online state is derived.
+    """
+    now = now_local()
+    active = Q(device__is_active=True)
+    locations = Location.objects.filter(id__in=view.get_location_ids(), is_active=True).annotate(
+        data_version=Sum('device__data_version', filter=active), devices=Count('device', filter=active),
+        devices_modified_at=Max('device__modified_at', filter=active),
+        last_ingest_at=Max('device__last_ingest_at', filter=active)).values_list(
+        'id', 'modified_at', 'data_version', 'devices', 'devices_modified_at', 'last_ingest_at').order_by('id')
+    version = []
+    last_modified = None
+    for location_id, modified_at, data_version, devices, devices_modified_at, last_ingest_at in locations:
+        online = is_online(last_ingest_at, now)
+        version.append((location_id, modified_at, data_version, devices, devices_modified_at, online))
+        last_modified = max(filter(None, (last_modified, modified_at, devices_modified_at,
+                                          get_status_changed_at(last_ingest_at, now))))
+    return (now.date(), version), last_modified, 0
+
+
+def location_devices_version(view, request):
+    """
+    Cache validator of the per location device summaries. For every active device of the location:
+    its data version, modification time and online state.
+    """
+    now = now_local()
+    try:
+        devices = list(view.filter_location_scope(Device.objects.filter(
+            location=request.query_params.get('location', 0), is_active=True)).values_list(
+            'id', 'data_version', 'modified_at', 'last_ingest_at').order_by('id'))
+    except (TypeError, ValueError):
+        devices = []
+    version = []
+    last_modified = None
+    for device_id, data_version, modified_at, last_ingest_at in devices:
+        version.append((device_id, data_version, modified_at, is_online(last_ingest_at, now)))
+        last_modified = max(filter(None, (last_modified, modified_at, get_status_changed_at(last_ingest_at, now))))
+    return (now.date(), version), last_modified, 0
+
+
+def is_online(last_ingest_at, now):
+    return last_ingest_at is not None and last_ingest_at + ONLINE_WINDOW > now
+
+
+def get_status_changed_at(last_ingest_at, now):
+    """
+    Time of the last online state change derived from the last reading: the reading itself, or the
+    end of its online window once it has passed.
+    """
+    if is_online(last_ingest_at, now) or last_ingest_at is None:
+        return last_ingest_at
+    return last_ingest_at + ONLINE_WINDOW
+
+
+def device_cache_scope(view, request):
+    return [('device', request.query_params.get('device'))]
+
+
+def location_cache_scope(view, request):
+    return [('location', request.query_params.get('location'))]
+
+
+def user_cache_scope(view, request):
+    """
+    The user scope is bumped when the locations of the user change, the ingest only bumps the
+    locations.
+    """
+    return [('user', request.user.pk)] + [('location', pk) for pk in view.get_location_ids()]
+
+
+def get_user_location_ids(user):
+    """
+    Ids of the locations assigned to `user` (`Location.user`). With a shared cache (`CACHE_URL`) they
+    are cached until the assignment changes, the process local cache can only be invalidated in the
+    worker handling the change, so without one the ids are queried every time (one indexed query).
+    """
+    if user is None or user.pk is None:
+        return []
+    queryset = Location.user.through.objects.filter(user_id=user.pk).values_list('location_id', flat=True)
+    if not settings.CACHE_URL:
+        return list(queryset)
+    key = LOCATION_SCOPE_KEY.format(user.pk)
+    location_ids = cache.get(key)
+    if location_ids is None:
+        location_ids = list(queryset)
+        cache.set(key, location_ids, settings.APP_CACHE_TIMEOUT)
+    return location_ids
+
+
+def invalidate_location_scope(*user_ids):
+    """
+    Drops the cached location ids of the users, and the cached dashboards built from them.
+    """
+    if user_ids:
+        cache.delete_many([LOCATION_SCOPE_KEY.format(user_id) for user_id in user_ids])
+        bump_version('user', *user_ids)
+
+
+def downsample_max(values, threshold):
+    """
+    Indexes of the points kept when a series of `values` is reduced to about `threshold` points:
+    the series is split in buckets of consecutive points, and the first maximum of each bucket is kept.
+    """
+    count = len(values)
+    if count < threshold:
+        return np.arange(count)
+    ratio = round(count / threshold)
+    starts = np.arange(0, count, ratio)
+    padded = np.full(len(starts) * ratio, -np.inf)
+    padded[:count] = np.where(np.isnan(values), -np.inf, values)
+    return starts + padded.reshape(-1, ratio).argmax(axis=1)
+
+
+def get_time_series(queryset, field, threshold):
+    """
+    Returns the `(timestamps, values)` arrays of `field` over `queryset`, ordered by time and
+    downsampled to about `threshold` points. Timestamps are UTC datetimes, missing values are NaN.
+    """
+    rows = list(queryset.order_by('created_at').values_list('created_at', field))
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=float)
+    timestamps, values = zip(*rows)
+    values = np.array(values, dtype=float)
+    indexes = downsample_max(values, threshold)
+    return np.array(timestamps, dtype=object)[indexes], values[indexes]
+
+
+def get_chart_axes(queryset, field, threshold):
+    """
+    `x_axis` (naive local times) and `y_axis` (values rounded to 3 decimals) of a chart of `field`.
+    """
+    timestamps, values = get_time_series(queryset, field, threshold)
+    y_axis = [None if np.isnan(value) else value for value in np.round(values, 3).tolist()]
+    return {"x_axis": localtime_array(timestamps).tolist(), "y_axis": y_axis}
+
+
+def get_columnar_chart_axes(queryset, field, threshold, float32=False):
+    """
+    Compact variant of `get_chart_axes`. Times are UTC epoch milliseconds, sent as `x_start` and
+    `x_step` when the points are evenly spaced. With `float32` the values are sent as a base64 little
+    endian float32 array (`y_float32`, NaN for missing values) instead of a JSON list.
+    """
+    timestamps, values = get_time_series(queryset, field, threshold)
+    times = epoch_ms_array(timestamps)
+    data = {"encoding": "columnar", "timezone": timezone.get_current_timezone_name(), "count": len(times)}
+    steps = np.diff(times)
+    if len(steps) and (steps == steps[0]).all():
+        data.update({"x_start": int(times[0]), "x_step": int(steps[0])})
+    else:
+        data["x_axis"] = times.tolist()
+    if float32:
+        data["y_float32"] = base64.b64encode(values.astype('<f4').tobytes()).decode('ascii')
+    else:
+        data["y_axis"] = [None if np.isnan(value) else value for value in np.round(values, 3).tolist()]
+    return data
+
+
+def publish_reading(device, inverter_data, alarm_event=None):
+    """
+    Pushes a stored reading to the live subscribers of the device and of its location. `device` is
+    the instance loaded before `record_ingest`, so `last_ingest_at` is still the previous reading.
+    `alarm_event` is the event opened by the reading, if its alarm state changed.
+    """
+    channels = get_live_channels(device.pk, device.location_id)
+    pubsub = get_pubsub()
+    pubsub.publish(channels, {
+        "type": "reading", "device": device.pk, "location": device.location_id,
+        "created_at": inverter_data.created_at, "daily_energy": inverter_data.daily_energy,
+        "total_energy": inverter_data.total_energy, "op_active_power": inverter_data.op_active_power,
+        "specific_yields": inverter_data.specific_yields, "alarm_status": inverter_data.alarm_status,
+        "alarm_ops_state": inverter_data.alarm_ops_state, "alarm_name": inverter_data.alarm_name})
+    if device.last_ingest_at is None or device.last_ingest_at + ONLINE_WINDOW <= inverter_data.created_at:
+        pubsub.publish(channels, {"type": "status", "device": device.pk, "location": device.location_id,
+                                  "online": True, "since": inverter_data.created_at})
+    if alarm_event is not None:
+        pubsub.publish(channels, {"type": "alarm", "device": device.pk, "location": device.location_id,
+                                  "code": alarm_event.code, "state": alarm_event.state,
+                                  "ops_state": alarm_event.ops_state, "is_alarm": alarm_event.is_alarm,
+                                  "since": alarm_event.started_at})
+
+
+def get_live_channels(device_id, location_id):
+    channels = ['device:{}'.format(device_id)]
+    if location_id:
+        channels.append('location:{}'.format(location_id))
+    return channels
+
+
+def publish_offline_devices(now=None):
+    """
+    Pushes the online -> offline transitions (`status` events) of the devices whose last reading
+    became older than `ONLINE_WINDOW` since the previous check. Run by the beat every
+    `LIVE_STATUS_CHECK_SECONDS`, the time of the previous check is kept in the cache. Returns the
+    number of devices gone offline.
+    """
+    now = now or timezone.now()
+    checked_at = cache.get(OFFLINE_CHECK_KEY) or now - datetime.timedelta(seconds=settings.LIVE_STATUS_CHECK_SECONDS)
+    cache.set(OFFLINE_CHECK_KEY, now, None)
+    devices = list(Device.objects.filter(
+        is_active=True, last_ingest_at__gt=checked_at - ONLINE_WINDOW, last_ingest_at__lte=now - ONLINE_WINDOW
+    ).values_list('id', 'location_id', 'last_ingest_at'))
+    pubsub = get_pubsub()
+    for device_id, location_id, last_ingest_at in devices:
+        pubsub.publish(get_live_channels(device_id, location_id), {
+            "type": "status", "device": device_id, "location": location_id, "online": False,
+            "since": last_ingest_at + ONLINE_WINDOW})
+    return len(devices)
@@ -0,0 +1,26 @@
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from .models import Location
+from .services import invalidate_location_scope
+
+
+@receiver(m2m_changed, sender=Location.user.through)
+def location_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidates the cached location scope of the users added to or removed from a location.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # `instance` is the user, `pk_set` the locations.
+        invalidate_location_scope(instance.pk)
+    elif action == 'pre_clear':
+        invalidate_location_scope(*instance.user.values_list('id', flat=True))
+    else:
+        invalidate_location_scope(*(pk_set or ()))
+
+
+@receiver(pre_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    invalidate_location_scope(*instance.user.values_list('id', flat=True))
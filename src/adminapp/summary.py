@@ -0,0 +1,80 @@
+"""
+Inverter summary of a date range: energy, peak power, specific yield, availability and alarms per device.
+
+The closed days are read from the daily rollups in a single query grouped by device, the alarms being
+counted by a subquery. Today is not rolled up yet, its readings are aggregated on the fly.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .alarms import get_alarm_events
+from .analysis import get_window
+from .retention import get_daily_aggregates
+from ..base.utils.timezone import now_local
+
+INVERTER_SUMMARY_HEADER = ['Inverter', 'Energy (kWh)', 'Peak Power (kW)', 'Specific Yield (kWh/kWp)',
+                           'Total Energy (kWh)', 'Availability (%)', 'Alarms']
+
+
+def add_values(first, second):
+    return second if first is None else first if second is None else first + second
+
+
+def max_values(first, second):
+    return second if first is None else first if second is None else max(first, second)
+
+
+def get_inverter_summary(devices, from_date, to_date):
+    """
+    Summary of every device of the `devices` queryset over the `[from_date, to_date]` date range.
+    """
+    from_date = datetime.date.fromisoformat(str(from_date))
+    to_date = datetime.date.fromisoformat(str(to_date))
+    today = now_local(only_date=True)
+    in_range = Q(devicedailyrollup__date__gte=from_date, devicedailyrollup__date__lte=to_date,
+                 devicedailyrollup__date__lt=today)
+    alarms = get_alarm_events(from_date, to_date, device=OuterRef('pk')).order_by().values('device').annotate(
+        count=Count('id')).values('count')
+    devices = devices.annotate(
+        readings=Coalesce(Sum('devicedailyrollup__readings', filter=in_range), 0),
+        energy=Sum('devicedailyrollup__daily_energy', filter=in_range),
+        peak_power=Max('devicedailyrollup__op_active_power_max', filter=in_range),
+        specific_yield=Sum('devicedailyrollup__specific_yields', filter=in_range),
+        total_energy=Max('devicedailyrollup__total_energy', filter=in_range),
+        alarms=Coalesce(Subquery(alarms, output_field=IntegerField()), 0),
+    ).order_by('id').values('id', 'device_name', 'imei', 'readings', 'energy', 'peak_power', 'specific_yield',
+                            'total_energy', 'alarms')
+    summary = {device['id']: device for device in devices}
+
+    if summary and to_date >= today:
+        for day in get_daily_aggregates(max(from_date, today), to_date + datetime.timedelta(days=1),
+                                        device__in=list(summary)):
+            device = summary[day['device']]
+            device['readings'] += day['readings']
+            device['energy'] = add_values(device['energy'], day['daily_energy'])
+            device['peak_power'] = max_values(device['peak_power'], day['op_active_power_max'])
+            device['specific_yield'] = add_values(device['specific_yield'], day['specific_yields'])
+            device['total_energy'] = max_values(device['total_energy'], day['total_energy'])
+
+    start, end = get_window(from_date, to_date)
+    window = (end - start).total_seconds()
+    for device in summary.values():
+        coverage = device['readings'] * settings.TELEMETRY_INTERVAL_SECONDS / window if window > 0 else 0
+        device['availability'] = round(100 * min(1, coverage), 2)
+    return list(summary.values())
+
+
+def get_inverter_summary_rows(location, from_date, to_date):
+    """
+    Rows of the "Inverter Summery" report sheet, one per device of the location.
+    """
+    rows = []
+    for device in get_inverter_summary(location.device_set.filter(is_active=True), from_date, to_date):
+        rows.append([device['device_name'] or device['imei']] + [
+            None if device[name] is None else round(device[name], 2)
+            for name in ('energy', 'peak_power', 'specific_yield', 'total_energy', 'availability')
+        ] + [device['alarms']])
+    return rows
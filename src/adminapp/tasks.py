@@ -1,15 +1,16 @@
 import datetime
+import shutil
 
-from pathlib import Path
-from openpyxl import Workbook
-from openpyxl.styles import Font
-
-from django.conf import settings
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
-from .models import InverterData, ZipReport, Location
-from ..base.utils.timezone import localtime
+from .constants import REPORT_STATUS_GENERATING, REPORT_STATUS_SUCCESS, REPORT_STATUS_ERROR, REPORT_STATUS_CANCELLED
+from .models import ZipReport, Location
+from .reports import get_report_directory, get_report_writer, write_location_report, ReportProgress, \
+    ReportCancelled
+from .report_cache import is_range_closed, get_cached_artifact, store_artifact, link_artifact
+from .retention import apply_retention
+from .services import publish_offline_devices
 
 logger = get_task_logger(__name__)
 
@@ -17,117 +18,52 @@ logger = get_task_logger(__name__)
 @shared_task(bind=True)
 def generate_zip(extra_key=None, location_list=None, report_id=None, from_date=None, to_date=None):
     report_instance = ZipReport.objects.filter(pk=report_id).first()
-    report_instance.status = "Generating"
-    report_instance.save()
+    progress = ReportProgress(report_instance)
+    if report_instance.cancel_requested:
+        progress.finish(REPORT_STATUS_CANCELLED)
+        return None
+    progress.start(len(location_list), REPORT_STATUS_GENERATING)
+    directory = get_report_directory(report_instance)
+    file_format, frequency = report_instance.file_format, report_instance.frequency
+    # Past ranges no longer receive readings, so their files can be shared between reports.
+    use_cache = is_range_closed(to_date)
     for record in location_list:
         try:
             location = Location.objects.filter(pk=record).first()
             report_instance.location.add(location)
-            context = None
-            inverter_data = InverterData.objects.filter(device__location=location,
-                                                        created_at__date__lte=to_date,
-                                                        created_at__date__gte=from_date,
-                                                        is_active=True).order_by('created_at').last()
-            if inverter_data:
-                context = {"total_energy": inverter_data.total_energy,
-                           "daily_energy": inverter_data.daily_energy,
-                           "op_active_power": inverter_data.op_active_power,
-                           "specific_yields": inverter_data.specific_yields}
-            wb = Workbook()
-            sheet = wb['Sheet']
-            wb.remove(sheet)
-            ws1 = wb.create_sheet("Plant Summery")
-            ws2 = wb.create_sheet("Plant Analysis")
-            # ws3 = wb.create_sheet("Grid Downtime Analysis")
-            # ws4 = wb.create_sheet("Inverter Summery ")
-            # ws5 = wb.create_sheet("Alarm Analysis")
-            # ws6 = wb.create_sheet("Help & Support")
-            plant_summery_data = []
-            plant_analysis_data = []
-
-            if context and inverter_data:
-                oap = float(inverter_data.op_active_power) if inverter_data.op_active_power else 0
-                nominal_power = float(inverter_data.nominal_power) if inverter_data.nominal_power else 0
-                irradiation = 0
-                insolation = 0
-                cuf = 0
-                pr = 0
-                if nominal_power != 0:
-                    irradiation = (oap * 1361) / nominal_power
-                    insolation = irradiation * 24
-                    normal_irradiation = nominal_power * irradiation
-                    cuf = (float(inverter_data.daily_energy) * 100) / (nominal_power * 24)
-                    if normal_irradiation != 0:
-                        pr = (oap * 1000 * 100) / normal_irradiation
-                plant_summery_data = [
-                    ['Plant Name', location.name],
-                    ['Date', from_date,
-                     to_date],
-                    ['Description',location.address ],
-                    ['Plant Capacity', location.capacity, "kWp"],
-                    ['Plant Manager', location.manager],
-                    ['Manager Phone', location.phone],
-                    [''],
-                    ['Daily Energy', context['daily_energy'] if 'daily_energy' in context else "--", "kWh"],
-                    ['Output Active Power', context['op_active_power'] if 'op_active_power' in context else "--",
-                     "kw"],
-                    ['Specific Yield', context['specific_yields'] if 'specific_yields' in context else "--",
-                     "(KWh/kwp)"],
-                    ['CUF', cuf, "%"],
-                    ['Performance Ratio', pr, "%"],
-                    ['Total Energy', context['total_energy'] if 'total_energy' in context else "--", "kwh"],
-                    ['Solar Insolation', insolation, "KWh/m2"],
-                    ['Solar Irradiation', irradiation, "W/m2"],
-                ]
-                all_inverter_data = InverterData.objects.filter(device__location=location,
-                                                                created_at__date__lte=to_date,
-                                                                created_at__date__gte=from_date,
-                                                                is_active=True)
-                for inverter in all_inverter_data.iterator():
-                    pr = 0
-                    cuf = 0
-                    irradiation = 0
-                    insolation = 0
-                    nominal_power = float(inverter.nominal_power) if inverter.nominal_power else 0
-                    if nominal_power != 0:
-                        irradiation = (oap * 1361) / nominal_power
-                        insolation = irradiation * 24
-                        normal_irradiation = nominal_power * irradiation
-                        cuf = (float(inverter.daily_energy) * 100) / (nominal_power * 24)
-                        if normal_irradiation != 0:
-                            pr = (oap * 1000 * 100) / normal_irradiation
-                    plant_analysis_data.append(
-                        [localtime(inverter.created_at).replace(tzinfo=None), inverter.daily_energy,
-                         inverter.op_active_power, inverter.specific_yields, cuf, pr, inverter.total_energy,
-                         insolation, irradiation])
+            if use_cache:
+                artifact = get_cached_artifact(location, from_date, to_date, frequency, file_format)
+                if artifact is None:
+                    artifact = store_artifact(location, from_date, to_date, frequency, file_format,
+                                              progress=progress)
+                else:
+                    progress.add_rows(artifact.rows)
+                report_instance.artifacts.add(artifact)
+                files = link_artifact(artifact, directory)
             else:
-                plant_summery_data = [
-                    ['Plant Name', location.name],
-                    ['Date', from_date,
-                     to_date],
-                    ['Description'],
-                    ['Plant Capacity', "", "kWp"],
-                    ['Plant Manager'],
-                    ['Manager Phone'],
-                    ['']]
-                plant_analysis_data = [['Error', "No data for the selected range"]]
-            for row in plant_summery_data:
-                ws1.append(row)
-            ws2.append(["Timestamp", "Daily Energy [ KWh ]", "Output Active Power [ KW ]",
-                        "Specific Yield [ KWh/kwp ]", "CUF [ % ]", "Performance Ratio [ % ]",
-                        "Total Energy [ kwh ]", "Solar Insolation [ KWh/m2 ]", "Solar Irradiation [ W/m2 ]"])
-            red_font = Font(bold=True, italic=True)
-            for cell in ws2["1:1"]:
-                cell.font = red_font
-            for row in plant_analysis_data:
-                ws2.append(row)
-            Path(settings.MEDIA_ROOT + "/" + str(report_instance.id)).mkdir(parents=True, exist_ok=True)
-            wb.save('{}/{}/{}.xlsx'.format(settings.MEDIA_ROOT, str(report_instance.id), location.name))
-        except Exception as e:
-            print(e)
-            report_instance.status = "Error"
-            report_instance.save()
+                writer = get_report_writer(file_format, directory, location.name)
+                files = write_location_report(writer, location, from_date, to_date, progress=progress)
+            progress.location_done(files)
+        except ReportCancelled:
+            shutil.rmtree(directory, ignore_errors=True)
+            progress.finish(REPORT_STATUS_CANCELLED)
+            return None
+        except Exception:
+            logger.exception("Report %s failed on location %s.", report_id, record)
+            progress.finish(REPORT_STATUS_ERROR)
             return None
-    report_instance.status = "Success"
-    report_instance.save()
+    progress.finish(REPORT_STATUS_SUCCESS)
     return None
+
+
+@shared_task(bind=True)
+def apply_retention_policy(extra_key=None):
+    report = apply_retention()
+    logger.info("Retention: %s rollups written, %s rows and about %s bytes reclaimed.", report["rollups"],
+                report["rows"], report["bytes"])
+    return report
+
+
+@shared_task(bind=True)
+def publish_device_status(extra_key=None):
+    return publish_offline_devices()
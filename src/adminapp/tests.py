@@ -1,3 +1,308 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .constants import INVERTER_TYPE_SUNGROW
+from .models import Location, Device, InverterData, ZipReport
+from .retention import update_rollups
+from .services import ONLINE_WINDOW
+from ..accounts.models import User
+from ..base.queries import get_query_budget
+
+INGEST_URL = '/api/v1/inverter/inverter_data/'
+
+
+def get_frame(imei, alarm_status='0000', alarm_name='0000'):
+    return json.dumps({"data": {"imei": imei, "uid": 2, "modbus": [
+        {"sid": 1, "rcnt": 2, "reg2": "0100", "reg4": "0010", "reg39": alarm_status, "reg46": alarm_name}]}})
+
+
+class FleetTestCase(TestCase):
+    """
+    Fleet of several plants and inverters, every inverter having sent three frames (one of them in
+    alarm) which are rolled up.
+    """
+    plants = 3
+    inverters = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(email='admin@example.com', is_superuser=True)
+        cls.user = User.objects.create(email='user@example.com')
+        for plant in range(cls.plants):
+            location = Location.objects.create(name='Plant {}'.format(plant), capacity='150',
+                                               inverter_type=INVERTER_TYPE_SUNGROW)
+            location.user.add(cls.user)
+            for inverter in range(cls.inverters):
+                Device.objects.create(device_name='INV-{}'.format(inverter), location=location,
+                                      imei='{}{}'.format(plant + 1, inverter + 1))
+        cls.location = Location.objects.order_by('id').first()
+        cls.device = Device.objects.order_by('id').first()
+        for report in range(3):
+            ZipReport.objects.create(user=cls.user, name='Report {}'.format(report)).location.set(
+                Location.objects.all())
+
+    def setUp(self):
+        cache.clear()
+        for device in Device.objects.all():
+            for alarm_status in ('0000', '5500', '0000'):
+                self.ingest(device.imei, alarm_status)
+        update_rollups(to_date=timezone.localdate() + datetime.timedelta(days=1))
+
+    def ingest(self, imei, alarm_status='0000'):
+        result = APIClient().post(INGEST_URL, get_frame(imei, alarm_status), content_type='application/json')
+        self.assertEqual(result.status_code, 200)
+        return result
+
+    def get_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def add_readings(self, device, times, **values):
+        """
+        Stores readings of `device` created at `times`, bypassing the ingest.
+        """
+        for created_at in times:
+            reading = InverterData.objects.create(device=device, imei=device.imei, **values)
+            InverterData.objects.filter(pk=reading.pk).update(created_at=created_at)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(FleetTestCase):
+    """
+    Every action declaring a query budget is requested over a fleet of several plants, inverters and
+    readings, so that N+1 queries exceed the budget: `QueryBudgetMiddleware` then raises
+    `QueryBudgetExceeded`.
+    """
+
+    def assertWithinBudget(self, client, path, method='get', **kwargs):
+        match = resolve(path.split('?')[0])
+        action = match.func.actions.get(method)
+        self.assertIsNotNone(get_query_budget(match.func, action), "{} has no query budget.".format(path))
+        result = getattr(client, method)(path, **kwargs)
+        self.assertEqual(result.status_code, 200, result.content)
+        return result
+
+    def test_location_actions(self):
+        client = self.get_client(self.user)
+        self.assertWithinBudget(client, '/api/v1/location/location_list/')
+        self.assertWithinBudget(client, '/api/v1/location/account_overview/')
+        self.assertWithinBudget(client, '/api/v1/location/user_locations/')
+        self.assertWithinBudget(self.get_client(self.admin), '/api/v1/location/fleet_overview/')
+
+    def test_device_actions(self):
+        client = self.get_client(self.user)
+        self.assertWithinBudget(client, '/api/v1/device/')
+        self.assertWithinBudget(client, '/api/v1/device/{}/'.format(self.device.pk))
+        self.assertWithinBudget(client, '/api/v1/device/downtime/?device={}'.format(self.device.pk))
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        self.assertWithinBudget(client, '/api/v1/device/downtime/?device={}&from_date={}&to_date={}'.format(
+            self.device.pk, yesterday - datetime.timedelta(days=40), yesterday))
+        self.assertWithinBudget(client, '/api/v1/device/inverter_summary/?location={}'.format(self.location.pk))
+        self.assertWithinBudget(client, '/api/v1/device/location_devices/?location={}'.format(self.location.pk))
+
+    def test_inverter_data_actions(self):
+        client = self.get_client(self.user)
+        self.assertWithinBudget(client, '/api/v1/inverter/')
+        self.assertWithinBudget(client, '/api/v1/inverter/location_devices/', method='post',
+                                data={'location': self.location.pk})
+        # The frames changing the alarm state run the most queries: they close and open an alarm event.
+        for alarm_status in ('5500', '0000'):
+            self.assertWithinBudget(APIClient(), INGEST_URL, method='post', data=get_frame(self.device.imei,
+                                                                                          alarm_status),
+                                    content_type='application/json')
+
+    def test_report_actions(self):
+        self.assertWithinBudget(self.get_client(self.user), '/api/v1/report/')
+
+    def test_alarm_event_actions(self):
+        client = self.get_client(self.user)
+        self.ingest(self.device.imei, '5500')
+        self.assertWithinBudget(client, '/api/v1/alarm/')
+        self.assertWithinBudget(client, '/api/v1/alarm/active/')
+
+
+class KeysetPaginationTests(FleetTestCase):
+
+    def get_page(self, client, path):
+        result = client.get(path)
+        self.assertEqual(result.status_code, 200, result.content)
+        return result.data
+
+    def test_pages_follow_the_keyset_order(self):
+        client = self.get_client(self.user)
+        page = self.get_page(client, '/api/v1/inverter/?pagination=cursor&page_size=4&count=true')
+        self.assertEqual(page['count'], InverterData.objects.count())
+        self.assertIsNone(page['previous'])
+        pages = [page]
+        while page['next']:
+            page = self.get_page(client, page['next'])
+            pages.append(page)
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(ids, list(InverterData.objects.order_by('created_at', 'id').values_list('id', flat=True)))
+        self.assertEqual([row['id'] for row in self.get_page(client, pages[2]['previous'])['results']],
+                         [row['id'] for row in pages[1]['results']])
+
+    def test_invalid_cursor(self):
+        cursor = base64.urlsafe_b64encode(b'0|yesterday|1').decode('ascii')
+        result = self.get_client(self.user).get('/api/v1/inverter/?pagination=cursor&cursor={}'.format(cursor))
+        self.assertEqual(result.status_code, 404)
+
+
+class StreamingResponseTests(FleetTestCase):
+
+    def get_rows(self, result):
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.streaming)
+        return json.loads(b''.join(result.streaming_content))
+
+    def test_unpaginated_listing_is_streamed(self):
+        rows = self.get_rows(self.get_client(self.user).get('/api/v1/inverter/?pagination=false'))
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(InverterData.objects.values_list('id', flat=True)))
+
+    @override_settings(STREAMING_RESPONSE_CHUNK_SIZE=2, STREAMING_RESPONSE_MAX_ROWS=5)
+    def test_row_cap(self):
+        result = self.get_client(self.user).get('/api/v1/inverter/?pagination=false')
+        self.assertEqual(result['X-Row-Limit'], '5')
+        self.assertEqual(len(self.get_rows(result)), 5)
+
+    def test_flat_shape_requires_pagination(self):
+        result = self.get_client(self.user).get('/api/v1/inverter/?shape=flat&pagination=false')
+        self.assertEqual(result.status_code, 400)
+
+
+class InverterDataFilterTests(FleetTestCase):
+
+    def test_text_lookups_on_numeric_fields_are_rejected(self):
+        client = self.get_client(self.user)
+        for param in ('daily_energy__icontains=1', 'op_active_power__startswith=0'):
+            self.assertEqual(client.get('/api/v1/inverter/?{}'.format(param)).status_code, 400, param)
+
+    def test_range_and_alarm_filters(self):
+        client = self.get_client(self.user)
+        self.add_readings(self.device, [timezone.now()], daily_energy=50)
+        result = client.get('/api/v1/inverter/?daily_energy__gte=10&page_size=50')
+        self.assertEqual([row['daily_energy'] for row in result.data['results']], [50])
+        result = client.get('/api/v1/inverter/?alarm_status=On-Error&page_size=50')
+        self.assertEqual(result.data['count'], self.plants * self.inverters)
+
+
+class CacheInvalidationTests(FleetTestCase):
+
+    def get_status(self, result, pk):
+        self.assertEqual(result.status_code, 200, result.content)
+        return next(row['summary']['status'] for row in result.data['results'] if row['id'] == pk)
+
+    def test_ingest_changes_the_etag(self):
+        client = self.get_client(self.user)
+        path = '/api/v1/location/de_vs_time/?device={}'.format(self.device.pk)
+        result = client.get(path)
+        etag = result['ETag']
+        self.assertEqual(client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.ingest(self.device.imei)
+        result = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+        self.assertNotEqual(result['ETag'], etag)
+        self.assertEqual(len(result.data['y_axis']), 4)
+
+    def test_location_assignment_invalidates_the_dashboard(self):
+        client = self.get_client(self.user)
+        path = '/api/v1/location/user_locations/'
+        self.assertEqual(client.get(path).data['count'], self.plants)
+        self.location.user.remove(self.user)
+        self.assertEqual(client.get(path).data['count'], self.plants - 1)
+
+    def test_cached_status_goes_offline(self):
+        client = self.get_client(self.user)
+        paths = [('/api/v1/location/user_locations/', self.location.pk),
+                 ('/api/v1/device/location_devices/?location={}'.format(self.location.pk), self.device.pk)]
+        etags = {}
+        for path, pk in paths:
+            result = client.get(path)
+            self.assertNotEqual(self.get_status(result, pk), 'Offline')
+            etags[path] = result['ETag']
+            self.assertEqual(client.get(path)['ETag'], etags[path])
+        # The readings age without any write bumping the cache versions.
+        age = ONLINE_WINDOW + datetime.timedelta(minutes=1)
+        for reading in InverterData.objects.all():
+            InverterData.objects.filter(pk=reading.pk).update(created_at=reading.created_at - age)
+        for device in Device.objects.all():
+            Device.objects.filter(pk=device.pk).update(last_ingest_at=device.last_ingest_at - age)
+        for path, pk in paths:
+            result = client.get(path)
+            self.assertEqual(self.get_status(result, pk), 'Offline')
+            self.assertNotEqual(result['ETag'], etags[path])
+
+
+class DowntimeTests(FleetTestCase):
+
+    def setUp(self):
+        super(DowntimeTests, self).setUp()
+        self.day = timezone.localdate() - datetime.timedelta(days=1)
+        midnight = timezone.make_aware(datetime.datetime.combine(self.day, datetime.time.min))
+        # A reading every 5 minutes, but none from 06:05 to 06:55.
+        self.times = [midnight + datetime.timedelta(minutes=minutes) for minutes in range(0, 24 * 60, 5)
+                      if not 6 * 60 < minutes < 7 * 60]
+        self.outage_start = midnight + datetime.timedelta(hours=6, minutes=5)
+        self.add_readings(self.device, self.times)
+
+    def get_downtime(self, from_date, to_date):
+        result = self.get_client(self.user).get('/api/v1/device/downtime/?device={}&from_date={}&to_date={}'.format(
+            self.device.pk, from_date, to_date))
+        self.assertEqual(result.status_code, 200, result.content)
+        return result.data
+
+    def test_gap_is_an_outage(self):
+        downtime = self.get_downtime(self.day, self.day)
+        self.assertEqual(downtime['resolution'], 'reading')
+        self.assertEqual(downtime['readings'], len(self.times))
+        self.assertEqual(downtime['downtime_seconds'], 55 * 60)
+        self.assertEqual([(outage['start'], outage['seconds']) for outage in downtime['outages']],
+                         [(self.outage_start, 55 * 60)])
+        self.assertEqual(downtime['availability'], round(100 * (1 - 55 / (24 * 60)), 2))
+
+    @override_settings(DOWNTIME_RAW_MAX_DAYS=1)
+    def test_long_ranges_use_the_rollups(self):
+        update_rollups(from_date=self.day, to_date=self.day + datetime.timedelta(days=1))
+        InverterData.objects.filter(device=self.device, created_at__date__lt=timezone.localdate()).delete()
+        downtime = self.get_downtime(self.day - datetime.timedelta(days=1), self.day)
+        self.assertEqual(downtime['resolution'], 'day')
+        self.assertEqual(downtime['readings'], len(self.times))
+        # The day without rollup is an outage, the gap of the rolled up day is downtime without outage.
+        self.assertEqual(len(downtime['outages']), 1)
+        self.assertEqual(downtime['downtime_seconds'], 24 * 60 * 60 + 55 * 60)
+
+
+class InverterSummaryTests(FleetTestCase):
+
+    def test_summary_adds_the_rollups_and_today(self):
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        noon = timezone.make_aware(datetime.datetime.combine(yesterday, datetime.time(12)))
+        self.add_readings(self.device, [noon], daily_energy=5, total_energy=100, op_active_power=7)
+        self.add_readings(self.device, [noon + datetime.timedelta(hours=1)], daily_energy=8, total_energy=103,
+                          op_active_power=6)
+        update_rollups(from_date=yesterday, to_date=timezone.localdate())
+        # The raw readings of the closed days are not read any more.
+        InverterData.objects.filter(created_at__date=yesterday).delete()
+
+        result = self.get_client(self.user).get('/api/v1/device/inverter_summary/?location={}&from_date={}'
+                                                '&to_date={}'.format(self.location.pk, yesterday,
+                                                                     timezone.localdate()))
+        self.assertEqual(result.status_code, 200, result.content)
+        summary = {device['id']: device for device in result.data}
+        self.assertEqual(len(summary), self.inverters)
+        device = summary[self.device.pk]
+        self.assertEqual(device['readings'], 2 + 3)
+        self.assertAlmostEqual(device['energy'], 8 + 1.6)
+        self.assertEqual(device['peak_power'], 7)
+        self.assertEqual(device['alarms'], 1)
+        other = summary[Device.objects.filter(location=self.location).exclude(pk=self.device.pk).first().pk]
+        self.assertEqual(other['readings'], 3)
+        self.assertAlmostEqual(other['energy'], 1.6)
@@ -1,31 +1,46 @@
+import logging
 import shutil
 import re
 import json
+import time
 
 from decouple import config
 from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from datetime import datetime
+from rest_framework import mixins
 from rest_framework.decorators import action
-from django.db.models import Max, FloatField
-from django.db.models.functions import Coalesce
 
-from .models import Location, Device, InverterData, InverterJsonData, ZipReport
-from .filters import LocationFilter, DeviceFilter, InverterDataFilter, ZipReportFilter
+from .alarms import record_alarm_state
+from .analysis import get_downtime_analysis
+from .fleet import FLEET_TOP_PLANTS, FLEET_YIELD_DAYS, get_fleet_overview
+from .summary import get_inverter_summary
+from .metrics import INGEST_FRAMES, INGEST_REJECTS, INGEST_DECODE_LATENCY, INGEST_STORED
+from .models import Location, Device, InverterData, InverterJsonData, ZipReport, AlarmEvent
+from .filters import LocationFilter, DeviceFilter, InverterDataFilter, ZipReportFilter, AlarmEventFilter
 from .serializers import LocationSerializer, DeviceSerializer, InverterDataSerializer, LocationSummarySerializer, \
-    DeviceSummarySerializer, ZipReportSerializer, FileSerializer
-from .permissions import LocationPermissions, DevicePermissions, InverterDataPermissions, ZipReportPermissions
-from .constants import INVERTER_TYPE_SUNGROW, INVERTER_TYPE_ABB
-from .services import operation_state_check, alarm_name_check, alarm_status_check
+    DeviceSummarySerializer, ZipReportSerializer, FileSerializer, InverterDataFlatSerializer, AlarmEventSerializer
+from .mixins import LocationScopeMixin
+from .permissions import LocationPermissions, DevicePermissions, InverterDataPermissions, ZipReportPermissions, \
+    AlarmEventPermissions
+from .constants import INVERTER_TYPE_SUNGROW, INVERTER_TYPE_ABB, REPORT_STATUS_SUCCESS, REPORT_STATUS_ERROR, \
+    REPORT_STATUS_CANCELLED
+from .services import operation_state_check, alarm_name_check, alarm_status_check, record_ingest, \
+    device_data_version, user_locations_version, location_devices_version, device_cache_scope, location_cache_scope, \
+    user_cache_scope, get_chart_axes, get_columnar_chart_axes, publish_reading
 from ..base import response
-from ..base.api.viewsets import ModelViewSet
-from ..base.api.pagination import StandardResultsSetPagination
+from ..base.cache import cached_action
+from ..base.api.decorators import conditional
+from ..base.api.viewsets import ModelViewSet, GenericViewSet
+from ..base.api.pagination import StandardResultsSetPagination, KeysetPagination, is_pagination_disabled
 from ..base.utils import timezone
-from ..base.utils.timezone import localtime
+
+logger = logging.getLogger(__name__)
 
 now = timezone.now_local()
 
 
-class LocationViewSet(ModelViewSet):
+class LocationViewSet(LocationScopeMixin, ModelViewSet):
     """
     Here we have user login, logout, endpoints.
     """
@@ -34,6 +49,7 @@ class LocationViewSet(ModelViewSet):
     pagination_class = StandardResultsSetPagination
     permission_classes = (LocationPermissions,)
     filterset_class = None
+    location_scope_field = 'id'
 
     def get_queryset(self):
         queryset = super(LocationViewSet, self).get_queryset()
@@ -44,21 +60,20 @@ class LocationViewSet(ModelViewSet):
 
     @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
     def location_list(self, request):
-        queryset = Location.objects.filter(is_active=True)
+        queryset = self.filter_location_scope(Location.objects.filter(is_active=True))
         queryset = queryset.order_by('name')
         self.filterset_class = LocationFilter
         queryset = self.filter_queryset(queryset)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            return self.get_paginated_response(LocationSerializer(page, many=True).data)
-        return response.Ok(LocationSerializer(queryset, many=True).data)
+        return self.get_list_response(queryset, LocationSerializer)
 
     @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @conditional(user_locations_version)
+    @cached_action(scopes=user_cache_scope)
     def account_overview(self, request):
-        queryset = Location.objects.filter(user__id=request.user.pk, is_active=True)
+        location_ids = self.get_location_ids()
+        queryset = Location.objects.filter(id__in=location_ids, is_active=True)
         location_count = queryset.count()
-        all_devices = Device.objects.filter(location__user__id=request.user.pk, location__is_active=True,
-                                            is_active=True)
+        all_devices = Device.objects.filter(location__in=location_ids, location__is_active=True, is_active=True)
         device_count = all_devices.count()
         capacity = 0
         for record in queryset.iterator():
@@ -66,34 +81,51 @@ class LocationViewSet(ModelViewSet):
                 capacity += int(record.capacity)
             except:
                 pass
-        inverter_count = all_devices.count()
+        inverter_count = device_count
         etotal = 0
-        for record in all_devices.iterator():
-            inverter_data = InverterData.objects.filter(device=record).order_by('-created_at').first()
-            if inverter_data and inverter_data.total_energy:
-                etotal += int(inverter_data.total_energy)
+        # The total energy of the last reading of every device, in one query.
+        last_total_energy = InverterData.objects.filter(device=OuterRef('pk')).order_by('-created_at').values(
+            'total_energy')[:1]
+        for total_energy in all_devices.annotate(total_energy=Subquery(last_total_energy)).values_list(
+                'total_energy', flat=True):
+            if total_energy:
+                etotal += int(total_energy)
         co2_saved = etotal * 0.8
         context = {"location_count": location_count, "device_count": device_count, "capacity": capacity,
                    "inverter_count": inverter_count, "co2_saved": co2_saved}
         return response.Ok(context)
 
+    @action(methods=['GET'], detail=False)
+    @cached_action(timeout=settings.FLEET_OVERVIEW_CACHE_TIMEOUT)
+    def fleet_overview(self, request):
+        try:
+            days = int(request.query_params.get('days', FLEET_YIELD_DAYS))
+            top = int(request.query_params.get('top', FLEET_TOP_PLANTS))
+        except ValueError:
+            return response.BadRequest({'detail': 'Invalid days or top!'})
+        if days < 1 or top < 1:
+            return response.BadRequest({'detail': 'Invalid days or top!'})
+        return response.Ok(get_fleet_overview(days=days, top=top))
+
     @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @conditional(user_locations_version)
+    @cached_action(scopes=user_cache_scope)
     def user_locations(self, request):
         date = request.query_params.get('date', str(datetime.now().strftime(("%Y-%m-%d"))))
-        queryset = Location.objects.filter(user__id=request.user.pk, is_active=True)
+        queryset = Location.objects.filter(id__in=self.get_location_ids(), is_active=True)
 
         # print(InverterDataSerializer(inverter_data, many=True).data)
 
         self.filterset_class = LocationFilter
         queryset = self.filter_queryset(queryset)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            return self.get_paginated_response(LocationSummarySerializer(page, many=True, context={"date": date}).data)
-        return response.Ok(LocationSummarySerializer(queryset, many=True, context={"date": date}).data)
+        return self.get_list_response(queryset, LocationSummarySerializer,
+                                      context={**self.get_serializer_context(), "date": date})
 
-    @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
-    def de_vs_time(self, request):
-        THRESHOLD_VALUE = int(config('THRESHOLD_VALUE'))
+    def get_chart_response(self, request, field):
+        """
+        Time series of `field` for the `device`, `from_date` and `to_date` query params. `?encoding=columnar`
+        returns the compact encoding of `get_columnar_chart_axes`, `&float32=true` packs the values.
+        """
         from_date = request.query_params.get('from_date', str(datetime.now().strftime(("%Y-%m-%d"))))
         to_date = request.query_params.get('to_date', str(datetime.now().strftime(("%Y-%m-%d"))))
         device_id = request.query_params.get('device')
@@ -101,68 +133,27 @@ class LocationViewSet(ModelViewSet):
                                                     created_at__date__lte=to_date,
                                                     created_at__date__gte=from_date,
                                                     is_active=True)
-        x_axis = []
-        y_axis = []
-        if not inverter_data:
-            return response.Ok({"x_axis": x_axis, "y_axis": y_axis})
-        count = inverter_data.count()
-        inverter_data = inverter_data.order_by('created_at')
-        results = []
-        if count < THRESHOLD_VALUE:
-            results = list(inverter_data.values('created_at', 'daily_energy'))
-        else:
-            ratio = round(count / THRESHOLD_VALUE)
-            for i in range(0, count, ratio):
-                selected_data = inverter_data[i:i + ratio]
-                max_energy = selected_data.aggregate(
-                    max_energy=Coalesce(Max('daily_energy', output_field=FloatField()), 0, output_field=FloatField()))
-                max_energy = max_energy.get('max_energy', 0)
-                instance = inverter_data.filter(id__in=selected_data.values_list('id', flat=True),
-                                                daily_energy=max_energy).first()
-                results.append({'created_at': instance.created_at, 'daily_energy': instance.daily_energy})
-        for i in results:
-            x_axis.append(localtime(i.get("created_at")).replace(tzinfo=None))
-            y_axis.append(round(i.get("daily_energy"), 3))
-        return response.Ok({"x_axis": x_axis, "y_axis": y_axis})
+        inverter_data = self.filter_location_scope(inverter_data, 'device__location')
+        threshold = int(config('THRESHOLD_VALUE'))
+        if request.query_params.get('encoding') == 'columnar':
+            float32 = request.query_params.get('float32') == 'true'
+            return response.Ok(get_columnar_chart_axes(inverter_data, field, threshold, float32=float32))
+        return response.Ok(get_chart_axes(inverter_data, field, threshold))
 
     @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @conditional(device_data_version)
+    @cached_action(scopes=device_cache_scope)
+    def de_vs_time(self, request):
+        return self.get_chart_response(request, 'daily_energy')
+
+    @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @conditional(device_data_version)
+    @cached_action(scopes=device_cache_scope)
     def oap_vs_time(self, request):
-        THRESHOLD_VALUE = int(config('THRESHOLD_VALUE'))
-        from_date = request.query_params.get('from_date', str(datetime.now().strftime(("%Y-%m-%d"))))
-        to_date = request.query_params.get('to_date', str(datetime.now().strftime(("%Y-%m-%d"))))
-        device_id = request.query_params.get('device')
-        inverter_data = InverterData.objects.filter(device=device_id,
-                                                    created_at__date__lte=to_date,
-                                                    created_at__date__gte=from_date,
-                                                    is_active=True)
-        x_axis = []
-        y_axis = []
-        if not inverter_data:
-            return response.Ok({"x_axis": x_axis, "y_axis": y_axis})
-        count = inverter_data.count()
-        inverter_data = inverter_data.order_by('created_at')
-        results = []
-        if count < THRESHOLD_VALUE:
-            results = list(inverter_data.values('created_at', 'op_active_power'))
-        else:
-            ratio = round(count / THRESHOLD_VALUE)
-            for i in range(0, count, ratio):
-                selected_data = inverter_data[i:i + ratio]
-                max_oap = selected_data.aggregate(
-                    max_energy=Coalesce(Max('op_active_power', output_field=FloatField()), 0,
-                                        output_field=FloatField()))
-                max_oap = max_oap.get('max_energy', 0)
-                instance = inverter_data.filter(id__in=selected_data.values_list('id', flat=True),
-                                                op_active_power=max_oap).first()
-                results.append({'created_at': instance.created_at, 'op_active_power': instance.op_active_power})
-
-        for i in results:
-            x_axis.append(localtime(i.get("created_at")).replace(tzinfo=None))
-            y_axis.append(round(i.get("op_active_power"), 3))
-        return response.Ok({"x_axis": x_axis, "y_axis": y_axis})
-
-
-class DeviceViewSet(ModelViewSet):
+        return self.get_chart_response(request, 'op_active_power')
+
+
+class DeviceViewSet(LocationScopeMixin, ModelViewSet):
     """
     Here we have user login, logout, endpoints.
     """
@@ -180,29 +171,68 @@ class DeviceViewSet(ModelViewSet):
         return queryset
 
     @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @conditional(location_devices_version)
+    @cached_action(scopes=location_cache_scope)
     def location_devices(self, request):
         start_date = request.query_params.get('start_date', str(datetime.now().strftime(("%Y-%m-%d"))))
         end_date = request.query_params.get('end_date', str(datetime.now().strftime(("%Y-%m-%d"))))
-        queryset = Device.objects.filter(location=request.query_params.get('location', 0), is_active=True)
+        queryset = self.filter_location_scope(
+            Device.objects.filter(location=request.query_params.get('location', 0), is_active=True))
         self.filterset_class = DeviceFilter
         queryset = self.filter_queryset(queryset)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            return self.get_paginated_response(
-                DeviceSummarySerializer(page, many=True, context={"start_date": start_date, "end_date": end_date}).data)
-        return response.Ok(DeviceSerializer(DeviceSummarySerializer, many=True,
-                                            context={"start_date": start_date, "end_date": end_date}).data)
+        return self.get_list_response(queryset, DeviceSummarySerializer,
+                                      context={**self.get_serializer_context(), "start_date": start_date,
+                                               "end_date": end_date})
+
+    @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    def downtime(self, request):
+        today = str(datetime.now().strftime(("%Y-%m-%d")))
+        # A window ending now grows without new readings (a silent device is the current outage), only the
+        # closed ranges are cached.
+        if request.query_params.get('to_date', today) < today:
+            return self.get_closed_downtime_response(request)
+        return self.get_downtime_response(request)
 
+    @conditional(device_data_version)
+    @cached_action(scopes=device_cache_scope)
+    def get_closed_downtime_response(self, request):
+        return self.get_downtime_response(request)
 
-class InverterDataViewSet(ModelViewSet):
+    def get_downtime_response(self, request):
+        from_date = request.query_params.get('from_date', str(datetime.now().strftime(("%Y-%m-%d"))))
+        to_date = request.query_params.get('to_date', str(datetime.now().strftime(("%Y-%m-%d"))))
+        try:
+            device = self.filter_location_scope(Device.objects.filter(pk=request.query_params.get('device'),
+                                                                      is_active=True)).first()
+            return response.Ok(get_downtime_analysis(device, from_date, to_date)) if device else \
+                response.BadRequest({'detail': 'Device not found!'})
+        except ValueError:
+            return response.BadRequest({'detail': 'Invalid device or date!'})
+
+    @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    @cached_action(scopes=location_cache_scope)
+    def inverter_summary(self, request):
+        from_date = request.query_params.get('from_date', str(datetime.now().strftime(("%Y-%m-%d"))))
+        to_date = request.query_params.get('to_date', str(datetime.now().strftime(("%Y-%m-%d"))))
+        try:
+            queryset = self.filter_location_scope(
+                Device.objects.filter(location=request.query_params.get('location', 0), is_active=True))
+            return response.Ok(get_inverter_summary(queryset, from_date, to_date))
+        except ValueError:
+            return response.BadRequest({'detail': 'Invalid location or date!'})
+
+
+class InverterDataViewSet(LocationScopeMixin, ModelViewSet):
     """
     Here we have user login, logout, endpoints.
     """
     queryset = InverterData.objects.all()
     serializer_class = InverterDataSerializer
     pagination_class = StandardResultsSetPagination
+    cursor_pagination_class = KeysetPagination
     permission_classes = (InverterDataPermissions,)
     filterset_class = None
+    location_scope_field = 'device__location'
 
     def get_queryset(self):
         queryset = super(InverterDataViewSet, self).get_queryset()
@@ -215,28 +245,48 @@ class InverterDataViewSet(ModelViewSet):
         data = self.request.data
         serializer.save(data=data)
 
+    def get_list_response(self, queryset, serializer_class=None, context=None):
+        if self.request.query_params.get('shape') != 'flat':
+            return super(InverterDataViewSet, self).get_list_response(queryset, serializer_class, context)
+        # The rows only carry the device id, the devices are sent once per page in `included`.
+        if self.paginator is None or is_pagination_disabled(self.request):
+            return response.BadRequest({'detail': 'The flat shape requires pagination!'})
+        queryset = InverterDataFlatSerializer.get_queryset(queryset)
+        serializer = InverterDataFlatSerializer(self.paginate_queryset(queryset), many=True)
+        paginated_response = self.get_paginated_response(serializer.data)
+        paginated_response.data['included'] = serializer.get_included()
+        return paginated_response
+
     @action(methods=['POST'], detail=False)
     def inverter_data(self, request):
+        INGEST_FRAMES.inc()
         data = None
         try:
             raw_data = request.body.decode('utf-8').replace(" ", "")
             raw_data = re.sub(":([\w\.]+)", r':"\1"', raw_data)
             data = json.loads(raw_data)
         except Exception as e:
-            print(str(e))
+            logger.warning("Invalid inverter frame: %s", e)
         InverterJsonData.objects.create(data=data)
-        data = data.pop("data", None)
+        data = data.pop("data", None) if isinstance(data, dict) else None
+        if not isinstance(data, dict):
+            INGEST_REJECTS.inc(reason='invalid_frame')
+            return response.BadRequest({'detail': 'Invalid data!'})
         imei = data.get('imei', None)
         if imei is None:
+            INGEST_REJECTS.inc(reason='missing_imei')
             return response.BadRequest({'detail': 'IMEI number is required!'})
-        device = Device.objects.filter(imei=imei).first()
+        device = Device.objects.select_related('location').filter(imei=imei).first()
         if not device:
+            INGEST_REJECTS.inc(reason='unknown_imei')
             return response.BadRequest({'detail': 'This IMEI number is not used by any device!'})
 
         uid = data.get('uid', None)
         modbus = data.get('modbus', None)
         sid = rcnt = None
-        if device.location.inverter_type == INVERTER_TYPE_SUNGROW:
+        inverter_type = device.location.inverter_type
+        decode_started = time.perf_counter()
+        if inverter_type == INVERTER_TYPE_SUNGROW:
             if modbus:
                 modbus = modbus[0]
                 sid = modbus.get('sid', None)
@@ -292,7 +342,7 @@ class InverterDataViewSet(ModelViewSet):
                     alarm_date += str(alarm_sec)
                 if len(alarm_date) == 0:
                     alarm_date = None
-        elif device.location.inverter_type == INVERTER_TYPE_ABB:
+        elif inverter_type == INVERTER_TYPE_ABB:
             if modbus:
                 modbus = modbus[0]
                 sid = modbus.get('sid', None)
@@ -351,14 +401,20 @@ class InverterDataViewSet(ModelViewSet):
                 if len(alarm_date) == 0:
                     alarm_date = None
         else:
+            INGEST_REJECTS.inc(reason='invalid_inverter_type')
             return response.BadRequest({'detail': 'Invalid Inverter type!'})
-        InverterData.objects.create(device=device, imei=imei, sid=sid, uid=uid, rcnt=rcnt, daily_energy=daily_energy,
+        INGEST_DECODE_LATENCY.observe(time.perf_counter() - decode_started, inverter_type=inverter_type)
+        inverter_data = InverterData.objects.create(device=device, imei=imei, sid=sid, uid=uid, rcnt=rcnt, daily_energy=daily_energy,
                                     total_energy=total_energy, op_active_power=op_active_power,
                                     specific_yields=specific_yields, inverter_op_active_power=inverter_op_active_power,
                                     inverter_daily_energy=inverter_daily_energy, nominal_power=nominal_power,
                                     inverter_total_energy=inverter_total_energy, meter_active_power=meter_active_power,
                                     alarm_status=alarm_status, alarm_ops_state=alarm_ops_state, alarm_name=alarm_name,
                                     alarm_date=alarm_date)
+        record_ingest(device, inverter_data.created_at)
+        alarm_event = record_alarm_state(device, inverter_data)
+        publish_reading(device, inverter_data, alarm_event)
+        INGEST_STORED.inc(inverter_type=inverter_type)
         return response.Ok({"detail": "Data stored successfully!"})
 
     @action(methods=['POST'], detail=False, pagination_class=StandardResultsSetPagination)
@@ -368,15 +424,14 @@ class InverterDataViewSet(ModelViewSet):
         queryset = InverterData.objects.filter(
             device__in=Device.objects.filter(location=request.data['location'], is_active=True),
             is_active=True).order_by('id')
+        queryset = self.filter_location_scope(queryset)
         self.filterset_class = InverterDataFilter
         queryset = self.filter_queryset(queryset)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            return self.get_paginated_response(InverterDataSerializer(page, many=True, context={"date": date}).data)
-        return response.Ok(InverterDataSerializer(queryset, many=True, context={"date": date}).data)
+        return self.get_list_response(queryset, InverterDataSerializer,
+                                      context={**self.get_serializer_context(), "date": date})
 
 
-class ZipReportViewSet(ModelViewSet):
+class ZipReportViewSet(LocationScopeMixin, ModelViewSet):
     """
     Here we have user login, logout, endpoints.
     """
@@ -385,10 +440,13 @@ class ZipReportViewSet(ModelViewSet):
     pagination_class = StandardResultsSetPagination
     permission_classes = (ZipReportPermissions,)
     filterset_class = None
+    # Reports are already scoped by owner, the locations are checked on creation.
+    location_scope_field = None
 
     def get_queryset(self):
         queryset = super(ZipReportViewSet, self).get_queryset()
-        queryset = queryset.filter(user=self.request.user.pk, is_active=True).order_by('-id')
+        queryset = queryset.filter(user=self.request.user.pk, is_active=True).prefetch_related('location')
+        queryset = queryset.order_by('-id')
         self.filterset_class = ZipReportFilter
         queryset = self.filter_queryset(queryset)
         return queryset
@@ -396,6 +454,7 @@ class ZipReportViewSet(ModelViewSet):
     def perform_create(self, serializer):
         data = self.request.data
         user = self.request.user
+        self.check_location_scope(location.id for location in serializer.validated_data.get('location', []))
         serializer.save(user=user)
 
     @action(methods=['GET'], detail=False)
@@ -409,3 +468,37 @@ class ZipReportViewSet(ModelViewSet):
         # response = HttpResponse(zip_file, content_type='application/zip')
         # response['Content-Disposition'] = 'attachment; filename=name.zip'
         return response.Ok({"path": "/" + str(queryset.id) + "-zip" + "/" + str(queryset.name) + ".zip"})
+
+    @action(methods=['POST'], detail=True)
+    def cancel(self, request, pk=None):
+        instance = self.get_object()
+        if instance.status in (REPORT_STATUS_SUCCESS, REPORT_STATUS_ERROR, REPORT_STATUS_CANCELLED):
+            return response.BadRequest({"detail": "Report generation is already finished."})
+        # The running task picks the flag up between two chunks.
+        ZipReport.objects.filter(pk=instance.pk).update(cancel_requested=True)
+        return response.Ok({"detail": "Report cancellation requested."})
+
+
+class AlarmEventViewSet(LocationScopeMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericViewSet):
+    """
+    Alarm history of the devices, filter with `device`, `device__location`, `started_at__gte`, ...
+    """
+    queryset = AlarmEvent.objects.all()
+    serializer_class = AlarmEventSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = (AlarmEventPermissions,)
+    filterset_class = AlarmEventFilter
+    location_scope_field = 'device__location'
+
+    def get_queryset(self):
+        queryset = super(AlarmEventViewSet, self).get_queryset()
+        return queryset.order_by('-started_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_list_response(queryset)
+
+    @action(methods=['GET'], detail=False, pagination_class=StandardResultsSetPagination)
+    def active(self, request):
+        queryset = self.filter_queryset(self.get_queryset().filter(is_alarm=True, ended_at__isnull=True))
+        return self.get_list_response(queryset)
@@ -2,6 +2,8 @@
 ASGI config for src project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests under ``/api/v1/live/`` (Server-Sent Events and WebSockets) are served by the live
+telemetry app, everything else by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from .adminapp.live import LIVE_PATH, LiveTelemetryApp  # noqa: E402
+
+live_application = LiveTelemetryApp()
+
+
+async def application(scope, receive, send):
+    if scope['type'] in ('http', 'websocket') and scope['path'].startswith(LIVE_PATH):
+        return await live_application(scope, receive, send)
+    if scope['type'] == 'websocket':
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
@@ -0,0 +1,43 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def conditional(validator):
+    """
+    Conditional GET support for viewset actions.
+
+    `validator(view, request)` must be cheap (it runs before the action) and returns a
+    `(version, last_modified, max_age)` tuple. The ETag is derived from the version, the action,
+    the user and the query params. When the client already holds that version a 304 is returned
+    without running the action, otherwise the validators are added to the 200 response. The version
+    is kept on the view (`conditional_version`), `cached_action` adds it to its cache key so that a
+    cached body always matches its ETag.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            version, last_modified, max_age = validator(view, request)
+            view.conditional_version = version
+            query = sorted((key, request.query_params.getlist(key)) for key in request.query_params)
+            raw_etag = '{}:{}:{}:{}'.format(view.action, request.user.pk, query, version)
+            etag = quote_etag(hashlib.sha1(raw_etag.encode('utf-8')).hexdigest())
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = func(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, private=True, max_age=max_age or 0)
+            return response
+
+        return wrapper
+
+    return decorator
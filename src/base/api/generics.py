@@ -1,8 +1,44 @@
+from django.db.models.query import QuerySet
 from rest_framework import generics as DRF_generics
 from rest_framework import exceptions
 
+from .pagination import is_pagination_disabled
+from .. import response
+
 
 class GenericAPIView(DRF_generics.GenericAPIView):
+    # Alternative paginator the clients can select with `?pagination=cursor`
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        """
+        The paginator instance associated with the view, or `None`.
+        """
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            if self.cursor_pagination_class is not None and \
+                    self.request.query_params.get('pagination') == 'cursor':
+                pagination_class = self.cursor_pagination_class
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
+    def get_list_response(self, queryset, serializer_class=None, context=None):
+        """
+        Returns the paginated response of `queryset`. Unpaginated listings (`?pagination=false`)
+        are streamed instead of being serialized into a single list.
+        """
+        serializer_class = serializer_class or self.get_serializer_class()
+        context = self.get_serializer_context() if context is None else context
+        if isinstance(queryset, QuerySet) and hasattr(serializer_class, 'optimize_queryset'):
+            queryset = serializer_class(context=context).optimize_queryset(queryset)
+        if self.paginator is not None and is_pagination_disabled(self.request) and isinstance(queryset, QuerySet):
+            return response.StreamingOk(queryset, serializer_class, context=context)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer_class(page, many=True, context=context).data)
+        return response.Ok(serializer_class(queryset, many=True, context=context).data)
+
     def get_object(self):
         obj = super(GenericAPIView, self).get_object()
         self.check_action_permissions(self.request, self.action, obj)
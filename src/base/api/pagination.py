@@ -1,8 +1,20 @@
+import base64
 import json
 from collections import OrderedDict
 
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def is_pagination_disabled(request):
+    try:
+        return not json.loads(request.query_params.get("pagination", "true"))
+    except ValueError:
+        return False
 
 
 class DefaultPageNumberPagination(PageNumberPagination):
@@ -20,7 +32,7 @@ class DefaultPageNumberPagination(PageNumberPagination):
         ]))
 
     def paginate_queryset(self, queryset, request, view=None):
-        if not json.loads(request.query_params.get("pagination", "true")):
+        if is_pagination_disabled(request):
             return queryset
         return super().paginate_queryset(queryset, request, view)
 
@@ -29,3 +41,122 @@ class StandardResultsSetPagination(DefaultPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on `(created_at, id)`.
+
+    Every page is fetched with `WHERE (created_at, id) > cursor ORDER BY created_at, id LIMIT n`, so
+    deep pages cost the same as the first one. The total count is only computed when the client asks
+    for it with `?count=true`.
+
+    Viewsets opt in by setting `cursor_pagination_class`, clients then select it with `?pagination=cursor`.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('created_at', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.is_count_requested(request) else None
+        reverse, position = self.decode_cursor(request)
+
+        field, tiebreaker = self.ordering
+        if position is not None:
+            lookup = 'lt' if reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{'{}__{}'.format(field, lookup): position[0]}) |
+                Q(**{field: position[0], '{}__{}'.format(tiebreaker, lookup): position[1]}))
+        ordering = ['-' + name for name in self.ordering] if reverse else list(self.ordering)
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = self.get_position(results[-1])
+            if (has_more and reverse) or (position is not None and not reverse):
+                self.previous_position = self.get_position(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        content = OrderedDict()
+        if self.count is not None:
+            content['count'] = self.count
+        content['next'] = self.get_next_link()
+        content['previous'] = self.get_previous_link()
+        content['results'] = data
+        return Response(content)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def is_count_requested(self, request):
+        try:
+            return bool(json.loads(request.query_params.get(self.count_query_param, "false")))
+        except ValueError:
+            return False
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return tuple(item[name] for name in self.ordering)
+        return tuple(getattr(item, name) for name in self.ordering)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(False, self.next_position))
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(True, self.previous_position))
+
+    def encode_cursor(self, reverse, position):
+        raw = '{}|{}|{}'.format(int(reverse), position[0].isoformat(), position[1])
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, created_at, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError
+            return bool(int(reverse)), (created_at, int(pk))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_html(self):
+        return ''
@@ -10,7 +10,8 @@ from rest_framework.permissions import BasePermission
 
 class ResourcePermission(BasePermission):
     """
-    Base class for define resource permissions.
+    Base class for define resource permissions. An `<action>_query_budget` attribute declares the
+    maximum number of SQL queries of the action (see `src/base/queries.py`).
     """
 
     enough_perms = None
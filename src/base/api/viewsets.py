@@ -8,6 +8,8 @@ class ViewSetMixin(DRF_ViewSetMixin):
     """
     Overrides the `check_permissions` method to provide `action` keyword
     """
+    # Maximum number of SQL queries of the action, set with `@action(query_budget=...)`.
+    query_budget = None
 
     def check_action_permissions(self, request, action=None, obj=None):
         if action is None:
@@ -49,4 +51,7 @@ class ModelViewSet(mixins.CreateModelMixin,
     A viewset that provides default `create()`, `retrieve()`, `update()`,
     `partial_update()`, `destroy()` and `list()` actions.
     """
-    pass
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_list_response(queryset)
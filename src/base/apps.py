@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'src.base'
+
+    def ready(self):
+        from . import authentication  # noqa: F401
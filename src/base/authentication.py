@@ -0,0 +1,140 @@
+"""
+Token authentication with an in-process cache of the token -> user lookup.
+
+The snapshots are local to each worker process. Logout, password changes and user updates bump the
+version counters of the token and of the user in the Django cache (`bump_version`), every hit
+checks them so that the other processes drop their snapshot too. The counters are only shared
+between the processes with a shared cache (`CACHE_URL`), otherwise the other processes pick the
+change up when their entries expire (`TOKEN_CACHE_TTL`).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import bump_version, get_versions
+from .metrics import registry
+
+
+class TTLCache(object):
+    """
+    Bounded, thread safe LRU cache whose entries expire `ttl` seconds after being stored.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (expires, value) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits,
+                "misses": self.misses, "hit_ratio": self.hit_ratio}
+
+
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+
+
+@registry.register_collector
+def token_cache_metrics():
+    stats = token_cache.stats()
+    return [
+        ('surya_token_cache_lookups_total', 'counter', 'Token cache lookups by result.',
+         [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+        ('surya_token_cache_hit_ratio', 'gauge', 'Token cache hit ratio.', [({}, stats['hit_ratio'])]),
+        ('surya_token_cache_size', 'gauge', 'Tokens held by the token cache.', [({}, stats['size'])]),
+    ]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    `TokenAuthentication` serving repeated lookups of the same token from `token_cache`, as long as
+    the versions of the token and of its user are unchanged.
+    """
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        snapshot = self.cache.get(key)
+        if snapshot is not None and get_versions(get_token_scopes(key, snapshot[0].pk)) != snapshot[2]:
+            self.cache.delete(key)
+            snapshot = None
+        if snapshot is None:
+            user, token = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            # Read after the lookup, a change committed in between is then a version mismatch.
+            snapshot = (user, token, get_versions(get_token_scopes(key, user.pk)))
+            self.cache.set(key, snapshot)
+        user, token, versions = snapshot
+        # Requests get their own copy, views are free to modify `request.user`.
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+
+def get_token_scopes(key, user_id):
+    return [('auth-token', key), ('auth-user', user_id)]
+
+
+def invalidate_user_tokens(user_id):
+    token_cache.delete_where(lambda snapshot: snapshot[0].pk == user_id)
+    bump_version('auth-user', user_id)
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+    bump_version('auth-token', instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    # Covers password changes, deactivation and permission changes.
+    invalidate_user_tokens(instance.pk)
@@ -0,0 +1,83 @@
+"""
+Application cache of the expensive viewset actions (dashboard aggregates and time series).
+
+Cached entries are never deleted explicitly. Every entry key embeds the current value of one or
+more version counters (for ex. `("device", 12)`), writers bump the counter (`bump_version`) and the
+stale entries are simply not looked up any more until they expire.
+
+The counters are only shared between the workers with a shared cache (Redis, `CACHE_URL`). With the
+default process local cache, a bump is only seen by the worker which made it: the other workers keep
+serving their entries until they expire, `APP_CACHE_TIMEOUT` defaults to 30 seconds in that case.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import response
+from .utils.timezone import now_local
+
+VERSION_KEY = 'version:{namespace}:{pk}'
+ACTION_KEY = 'action:{view}:{action}:{user}:{digest}'
+
+
+def get_version_key(namespace, pk=None):
+    return VERSION_KEY.format(namespace=namespace, pk='' if pk is None else pk)
+
+
+def get_versions(scopes):
+    """
+    Returns the current version of each `(namespace, pk)` scope, with a single cache round trip.
+    """
+    keys = [get_version_key(namespace, pk) for namespace, pk in scopes]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_version(namespace, *pks):
+    """
+    Invalidates every cached entry depending on the given scopes.
+    """
+    for pk in pks or (None,):
+        key = get_version_key(namespace, pk)
+        # `add` is a no-op when the counter exists, so `incr` never races with a fresh `set`.
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter has been evicted in between.
+            cache.set(key, 1, timeout=None)
+
+
+def cached_action(timeout=None, scopes=None):
+    """
+    Caches the response data of a viewset action.
+
+    Entries are scoped by the action, the user, the query params and the current date (the actions
+    default their date range to today). `scopes(view, request)` returns the `(namespace, pk)` version
+    scopes the data depends on. Under `conditional`, the validator version is part of the key too:
+    it also covers the state derived from the time (ex: online devices), which no counter bumps.
+    Only successful, non streamed responses are cached.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            query = sorted((key, request.query_params.getlist(key)) for key in request.query_params)
+            versions = get_versions(scopes(view, request)) if scopes else []
+            raw_key = '{}:{}:{}:{}:{}'.format(query, versions, getattr(view, 'conditional_version', None),
+                                              now_local(only_date=True), sorted(kwargs.items()))
+            key = ACTION_KEY.format(view=view.__class__.__name__, action=view.action, user=request.user.pk,
+                                    digest=hashlib.sha1(raw_key.encode('utf-8')).hexdigest())
+            data = cache.get(key)
+            if data is not None:
+                return response.Ok(data)
+            result = func(view, request, *args, **kwargs)
+            if result.status_code == 200 and not getattr(result, 'streaming', False):
+                cache.set(key, result.data, settings.APP_CACHE_TIMEOUT if timeout is None else timeout)
+            return result
+
+        return wrapper
+
+    return decorator
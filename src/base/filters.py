@@ -0,0 +1,32 @@
+import django_filters
+from django.db import models
+
+# Lookups which cast the column to text, they can not use an index on a numeric column.
+TEXT_LOOKUPS = ('contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith',
+                'regex', 'iregex')
+NUMERIC_FIELDS = (models.IntegerField, models.FloatField, models.DecimalField, models.AutoField)
+
+
+class FilterSet(django_filters.FilterSet):
+    """
+    FilterSet which rejects text lookups (ex: `daily_energy__icontains`) on numeric fields
+    with a 400 response instead of silently ignoring them.
+    """
+
+    def get_rejected_params(self):
+        numeric_fields = set(field.name for field in self._meta.model._meta.concrete_fields
+                             if isinstance(field, NUMERIC_FIELDS))
+        rejected = []
+        for param in self.data.keys():
+            field_name, separator, lookup = param.rpartition('__')
+            if separator and field_name in numeric_fields and lookup in TEXT_LOOKUPS:
+                rejected.append(param)
+        return rejected
+
+    def is_valid(self):
+        valid = super(FilterSet, self).is_valid()
+        rejected = self.get_rejected_params()
+        for param in rejected:
+            self.form.add_error(None, "'{}' is not supported, numeric fields only support exact, gte and lte "
+                                      "lookups.".format(param))
+        return valid and not rejected
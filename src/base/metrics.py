@@ -0,0 +1,258 @@
+"""
+Lightweight in-process metrics, exposed in the Prometheus text format by `metrics_view`.
+
+    REQUESTS = registry.counter('surya_requests_total', 'Requests served.', ['view'])
+    REQUESTS.inc(view='device')
+    with LATENCY.time(view='device'):
+        ...
+
+Counters and histograms live in the memory of the process which records them. Values shared by
+several processes (for ex. the Celery workers) are exported with a collector instead, a function
+called on every scrape which returns `(name, type, help, [(labels, value), ...])` tuples.
+
+With several web workers (gunicorn, uwsgi), each one has its own counters and a scrape only returns
+those of the worker which served it: the series restart whenever another worker answers. Run one
+worker per scraped target, or scrape the workers individually, until the counters are shared.
+
+The endpoint requires a scrape token (`METRICS_TOKEN`, sent as `Authorization: Bearer <token>`) and
+a `METRICS_ALLOWED_IPS` address.
+"""
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape_label(value)) for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{} expects the labels {}.".format(self.name, ', '.join(self.labelnames)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.type)]
+        for name, labels, value in self.get_samples():
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self.get_key(labels), 0)
+
+    def get_samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        counts, total = self._values.get(self.get_key(labels), ((), 0))
+        return sum(counts)
+
+    def get_samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels + [('le', format_value(float(bound)))], cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("The metric {} is already registered.".format(metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda metric: metric.name):
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            for name, metric_type, documentation, samples in collector():
+                lines.append('# HELP {} {}'.format(name, documentation))
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                for labels, value in samples:
+                    lines.append('{}{} {}'.format(name, format_labels(sorted(labels.items())),
+                                                  format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+ACTION_REQUESTS = registry.counter('surya_api_requests_total', 'API requests by view, action and status code.',
+                                   ['view', 'action', 'status'])
+ACTION_LATENCY = registry.histogram('surya_api_request_duration_seconds', 'API request latency.',
+                                    ['view', 'action'])
+ACTION_QUERIES = registry.histogram('surya_api_request_queries', 'Database queries per API request.',
+                                    ['view', 'action'], buckets=QUERY_COUNT_BUCKETS)
+ACTION_DB_TIME = registry.histogram('surya_api_request_db_seconds', 'Database time per API request.',
+                                    ['view', 'action'])
+
+
+class QueryCounter(object):
+    """
+    Database execute wrapper (`connection.execute_wrapper`) counting and timing the queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_view_labels(request):
+    """
+    `(view, action)` of a request routed to a DRF view, None otherwise.
+    """
+    view_func = getattr(request, 'resolver_match', None) and request.resolver_match.func
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return None
+    method = request.method.lower()
+    return cls.__name__, (getattr(view_func, 'actions', None) or {}).get(method, method)
+
+
+class MetricsMiddleware(object):
+    """
+    Records the latency, database queries and database time of every DRF action.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        labels = get_view_labels(request)
+        if labels is not None:
+            view, action = labels
+            ACTION_REQUESTS.inc(view=view, action=action, status=response.status_code)
+            ACTION_LATENCY.observe(time.perf_counter() - start, view=view, action=action)
+            ACTION_QUERIES.observe(queries.count, view=view, action=action)
+            ACTION_DB_TIME.observe(queries.duration, view=view, action=action)
+        return response
+
+
+def is_scrape_allowed(request):
+    """
+    The request carries the `METRICS_TOKEN` bearer token and comes from a `METRICS_ALLOWED_IPS`
+    address. Without token, the endpoint is disabled.
+    """
+    if not settings.METRICS_TOKEN or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return False
+    authorization = request.META.get('HTTP_AUTHORIZATION', '').split()
+    return len(authorization) == 2 and authorization[0].lower() == 'bearer' and \
+        hmac.compare_digest(authorization[1].encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8'))
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, see `is_scrape_allowed`.
+    """
+    if not is_scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
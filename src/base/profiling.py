@@ -0,0 +1,196 @@
+"""
+On-demand profiling of a request, for the superusers (`AdminPerm`) only.
+
+    GET /api/v1/location/user_locations/?profile=cprofile      cProfile, pstats file (snakeviz, pstats)
+    GET /api/v1/location/user_locations/?profile=sampling      stack sampling, speedscope JSON
+
+The flag can also be sent as the `X-Profile` header. The profile is stored under `PROFILE_ROOT`, its
+file name is returned in the `X-Profile` response header, or the profile itself replaces the response
+with `profile_output=inline`. Profiled responses carry a `Server-Timing` header with the total, database,
+parse, serialize and render times (the last three include the queries they run). The body of streamed
+responses is produced after the profile ends.
+"""
+import cProfile
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from .api.permissions import AdminPerm
+from .metrics import QueryCounter
+
+
+def get_code_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+# Functions whose cumulative time is reported in the `Server-Timing` header.
+TIMED_FUNCTIONS = (
+    ('parse', get_code_key(Request._parse.__code__)),
+    ('serialize', get_code_key(BaseSerializer.data.fget.__code__)),
+    ('render', get_code_key(Response.rendered_content.fget.__code__)),
+)
+
+
+class CProfiler(object):
+    extension = 'prof'
+    content_type = 'application/octet-stream'
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.create_stats()
+
+    def get_duration(self, key):
+        # (primitive calls, calls, total time, cumulative time, callers)
+        return self.profile.stats.get(key, (0, 0, 0, 0, None))[3]
+
+    def export(self, name):
+        return marshal.dumps(self.profile.stats)
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stack of the profiled thread every `interval` seconds from a background thread.
+    Pure Python code only yields the GIL every `sys.getswitchinterval()`, which bounds the resolution.
+    """
+    extension = 'speedscope.json'
+    content_type = 'application/json'
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.PROFILE_SAMPLING_INTERVAL
+        self.samples = []
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sample(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                stack.append(get_code_key(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples.append((tuple(reversed(stack)), now - last))
+            last = now
+
+    def get_duration(self, key):
+        return sum(weight for stack, weight in self.samples if key in stack)
+
+    def export(self, name):
+        frames, indexes, samples = [], {}, []
+        for stack, weight in self.samples:
+            sample = []
+            for key in stack:
+                if key not in indexes:
+                    indexes[key] = len(frames)
+                    frames.append({"name": key[2], "file": key[0], "line": key[1]})
+                sample.append(indexes[key])
+            samples.append(sample)
+        weights = [weight for stack, weight in self.samples]
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "surya",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+                          "endValue": sum(weights), "samples": samples, "weights": weights}],
+        }).encode('utf-8')
+
+
+PROFILERS = {
+    'cprofile': CProfiler,
+    'sampling': SamplingProfiler,
+}
+
+
+def get_profile_mode(request):
+    mode = request.GET.get('profile') or request.META.get('HTTP_X_PROFILE')
+    return mode if mode in PROFILERS else None
+
+
+def is_profiling_allowed(request):
+    """
+    Authenticates the request like the API views do and checks `AdminPerm`.
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return bool(AdminPerm().has_permission(drf_request, None))
+    except APIException:
+        return False
+
+
+def get_server_timing(total, queries, profiler):
+    timings = ['total;dur={:.1f}'.format(total * 1000),
+               'db;dur={:.1f};desc="{} queries"'.format(queries.duration * 1000, queries.count)]
+    for name, key in TIMED_FUNCTIONS:
+        timings.append('{};dur={:.1f}'.format(name, profiler.get_duration(key) * 1000))
+    return ', '.join(timings)
+
+
+def store_profile(name, content, extension):
+    os.makedirs(settings.PROFILE_ROOT, exist_ok=True)
+    file_name = '{}-{}.{}'.format(name, uuid.uuid4().hex[:8], extension)
+    with open(os.path.join(settings.PROFILE_ROOT, file_name), 'wb') as profile_file:
+        profile_file.write(content)
+    return file_name
+
+
+class ProfilingMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = get_profile_mode(request)
+        if mode is None or not settings.PROFILING_ENABLED or not is_profiling_allowed(request):
+            return self.get_response(request)
+
+        profiler = PROFILERS[mode]()
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        total = time.perf_counter() - start
+
+        name = '{}-{}'.format(timezone.localtime().strftime('%Y%m%d-%H%M%S'),
+                              request.path.strip('/').replace('/', '-') or 'root')
+        content = profiler.export(name)
+        server_timing = get_server_timing(total, queries, profiler)
+        if request.GET.get('profile_output') == 'inline':
+            response = HttpResponse(content, content_type=profiler.content_type)
+            response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(name, profiler.extension)
+        else:
+            response['X-Profile'] = store_profile(name, content, profiler.extension)
+        response['Server-Timing'] = server_timing
+        return response
@@ -0,0 +1,184 @@
+"""
+In-process publish/subscribe hub for the live (ASGI) endpoints.
+
+Publishers are plain synchronous code (views, tasks), subscribers are coroutines of the ASGI event
+loop. Messages go through a broker:
+
+* `MemoryBroker` delivers to the subscribers of the current process only. It is meant for tests and
+  single process deployments where the ingest is served by the ASGI app itself.
+* `RedisBroker` publishes on a Redis channel, every ASGI process listens on it and fans the messages
+  out to its own subscribers.
+
+The broker is selected with the `PUBSUB_URL` setting (`memory://` or `redis://...`).
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 1000
+
+
+class Subscription(object):
+    """
+    Messages of a set of channels, consumed from the event loop which created the subscription.
+    Slow consumers lose the oldest messages rather than growing the queue without bound.
+    """
+
+    def __init__(self, hub, channels, maxsize=SUBSCRIPTION_QUEUE_SIZE):
+        self.hub = hub
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class PubSub(object):
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        broker.attach(self)
+
+    def publish(self, channels, message):
+        """
+        Publishes `message` (JSON serializable) once to all the `channels`, a subscriber of several of
+        them receives it once.
+        """
+        self.broker.publish(json.dumps({"channels": list(channels), "message": message}, cls=DjangoJSONEncoder))
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        self.broker.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def dispatch(self, payload):
+        """
+        Delivers a published payload to the local subscribers, can be called from any thread.
+        """
+        data = json.loads(payload)
+        with self._lock:
+            subscribers = set()
+            for channel in data["channels"]:
+                subscribers.update(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, data["message"])
+            except RuntimeError:
+                # The event loop of the subscriber is closed.
+                self.unsubscribe(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+
+class MemoryBroker(object):
+
+    def attach(self, hub):
+        self.hub = hub
+
+    def publish(self, payload):
+        self.hub.dispatch(payload)
+
+    def start(self):
+        pass
+
+
+class RedisBroker(object):
+    channel = 'surya:pubsub'
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self._listeners = {}
+
+    def attach(self, hub):
+        self.hub = hub
+
+    def publish(self, payload):
+        import redis
+
+        try:
+            self.client.publish(self.channel, payload)
+        except redis.RedisError:
+            # Live updates are best effort, never fail the publisher.
+            logger.exception("Unable to publish to %s.", self.channel)
+
+    def start(self):
+        """
+        Starts the listener of the current event loop, once.
+        """
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.done():
+            self._listeners[loop] = loop.create_task(self.listen())
+
+    async def listen(self):
+        from redis import asyncio as aioredis
+
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self.url)
+                pubsub = client.pubsub()
+                await pubsub.subscribe(self.channel)
+                async for item in pubsub.listen():
+                    if item["type"] == "message":
+                        self.hub.dispatch(item["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost the subscription to %s, reconnecting.", self.channel)
+                await asyncio.sleep(1)
+
+
+def get_broker(url):
+    if url.startswith('redis'):
+        return RedisBroker(url)
+    return MemoryBroker()
+
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+def get_pubsub():
+    global _pubsub
+    if _pubsub is None:
+        with _pubsub_lock:
+            if _pubsub is None:
+                _pubsub = PubSub(get_broker(settings.PUBSUB_URL))
+    return _pubsub
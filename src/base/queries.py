@@ -0,0 +1,151 @@
+"""
+SQL query budgets of the API actions.
+
+A budget is the maximum number of queries an action may run, declared next to its permissions:
+
+    class DevicePermissions(ResourcePermission):
+        list_perms = AdminPerm() | UserPerm()
+        list_query_budget = 6
+
+or as a keyword of the action, which takes precedence: `@action(methods=['GET'], detail=False,
+query_budget=4)`.
+
+`QueryBudgetMiddleware` records the queries of a sample (`QUERY_BUDGET_SAMPLE_RATE`) of the requests
+to the actions having a budget. Violations are logged with the most repeated query fingerprints,
+which points at the N+1 queries, and raise `QueryBudgetExceeded` when `QUERY_BUDGET_RAISE` is set
+(tests). `assert_max_queries` checks a block of code the same way.
+"""
+import logging
+import random
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .metrics import QueryCounter, get_view_labels, registry
+
+logger = logging.getLogger(__name__)
+
+BUDGET_VIOLATIONS = registry.counter('surya_query_budget_violations_total',
+                                     'API requests exceeding the query budget of their action.', ['view', 'action'])
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+VALUES_RE = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalized form of a query: literals and placeholders replaced by `?`, lists and bulk values
+    collapsed, so that the queries of an N+1 pattern share the same fingerprint.
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('(...)', sql)
+    sql = VALUES_RE.sub(r'\1', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder(QueryCounter):
+    """
+    `QueryCounter` also keeping the statements, fingerprinted on demand.
+    """
+
+    def __init__(self):
+        super(QueryRecorder, self).__init__()
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return super(QueryRecorder, self).__call__(execute, sql, params, many, context)
+
+    def get_fingerprints(self, limit=5):
+        """
+        The `limit` most frequent fingerprints with their number of queries.
+        """
+        return Counter(fingerprint(sql) for sql in self.statements).most_common(limit)
+
+    def get_report(self, limit=5):
+        return '{} queries in {:.1f} ms, most frequent:\n{}'.format(
+            self.count, self.duration * 1000,
+            '\n'.join('  {} x {}'.format(count, sql) for count, sql in self.get_fingerprints(limit)))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_query_budget(view_func, action):
+    """
+    Query budget of `action` of a routed DRF view: the `query_budget` keyword of the action, else the
+    `<action>_query_budget` attribute of its permission classes (the lowest one). None without budget.
+    """
+    initkwargs = getattr(view_func, 'initkwargs', None) or {}
+    if initkwargs.get('query_budget') is not None:
+        return initkwargs['query_budget']
+    budgets = [getattr(permission, '{}_query_budget'.format(action), None)
+               for permission in getattr(view_func.cls, 'permission_classes', ())]
+    budgets = [budget for budget in budgets if budget is not None]
+    return min(budgets) if budgets else None
+
+
+class QueryBudgetMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(lambda *args: self.record(request, recorder, *args)):
+            response = self.get_response(request)
+        if request.query_budget is not None and recorder.count > request.query_budget:
+            self.budget_exceeded(request, recorder)
+        return response
+
+    @staticmethod
+    def record(request, recorder, execute, sql, params, many, context):
+        # The budget is only known once the view is resolved, the queries of the middlewares
+        # running before it are not part of the action.
+        if request.query_budget is None:
+            return execute(sql, params, many, context)
+        return recorder(execute, sql, params, many, context)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        labels = get_view_labels(request)
+        sampled = settings.QUERY_BUDGET_RAISE or random.random() < settings.QUERY_BUDGET_SAMPLE_RATE
+        if labels is None or not sampled:
+            return None
+        request.query_budget = get_query_budget(view_func, labels[1])
+        return None
+
+    def budget_exceeded(self, request, recorder):
+        view, action = get_view_labels(request)
+        BUDGET_VIOLATIONS.inc(view=view, action=action)
+        message = 'Query budget of {}.{} exceeded ({} > {}): {}'.format(view, action, recorder.count,
+                                                                     request.query_budget, recorder.get_report())
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+@contextmanager
+def assert_max_queries(budget, using=None):
+    """
+    Test helper failing when the wrapped block runs more than `budget` queries:
+
+        with assert_max_queries(4):
+            client.get('/api/v1/device/')
+    """
+    recorder = QueryRecorder()
+    with connections[using or 'default'].execute_wrapper(recorder):
+        yield recorder
+    if recorder.count > budget:
+        raise QueryBudgetExceeded('Query budget exceeded ({} > {}): {}'.format(recorder.count, budget,
+                                                                               recorder.get_report()))
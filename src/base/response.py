@@ -1,7 +1,12 @@
 """The various HTTP responses for use in returning proper HTTP codes."""
+import json
+
 from django import http
+from django.conf import settings
+from django.db.models import prefetch_related_objects
 
 import rest_framework.response
+from rest_framework.utils.encoders import JSONEncoder
 
 
 class Response(rest_framework.response.Response):
@@ -24,6 +29,51 @@ class Ok(Response):
     status_code = 200
 
 
+class StreamingOk(http.StreamingHttpResponse):
+    """200 OK, streamed
+
+    Returns a queryset as a JSON array without holding the whole result in
+    memory. Rows are read with `QuerySet.iterator`, serialized `chunk_size`
+    at a time and written out as fragments of the array. At most `max_rows`
+    rows are returned, the limit is reported in the `X-Row-Limit` header.
+    """
+    status_code = 200
+
+    def __init__(self, queryset, serializer_class, context=None, chunk_size=None, max_rows=None):
+        chunk_size = chunk_size or settings.STREAMING_RESPONSE_CHUNK_SIZE
+        max_rows = max_rows or settings.STREAMING_RESPONSE_MAX_ROWS
+        super(StreamingOk, self).__init__(
+            self.stream(queryset[:max_rows], serializer_class, context or {}, chunk_size),
+            content_type='application/json')
+        self['X-Row-Limit'] = str(max_rows)
+
+    @staticmethod
+    def stream(queryset, serializer_class, context, chunk_size):
+        # `iterator()` ignores `prefetch_related`, the lookups are applied chunk by chunk instead.
+        prefetch_lookups = queryset._prefetch_related_lookups
+        separator = ''
+        chunk = []
+        yield '['
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(instance)
+            if len(chunk) < chunk_size:
+                continue
+            yield separator + StreamingOk.encode(chunk, serializer_class, context, prefetch_lookups)
+            separator = ','
+            chunk = []
+        if chunk:
+            yield separator + StreamingOk.encode(chunk, serializer_class, context, prefetch_lookups)
+        yield ']'
+
+    @staticmethod
+    def encode(chunk, serializer_class, context, prefetch_lookups=()):
+        if prefetch_lookups and not isinstance(chunk[0], (dict, tuple)):
+            prefetch_related_objects(chunk, *prefetch_lookups)
+        data = serializer_class(chunk, many=True, context=context).data
+        # Drop the enclosing brackets, the chunk becomes a fragment of the streamed array.
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))[1:-1]
+
+
 class Created(Response):
     """201 Created
 
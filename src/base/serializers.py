@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.utils import html
 from rest_framework.fields import empty
 
@@ -7,6 +8,30 @@ from django.db.models import query
 from django.core.exceptions import ObjectDoesNotExist
 
 
+def get_query_param_list(request, name):
+    """
+    Values of a list query parameter, given either comma separated (`?fields=id,name`)
+    or repeated (`?fields=id&fields=name`).
+    """
+    values = []
+    for value in request.query_params.getlist(name):
+        values.extend(item.strip() for item in value.split(',') if item.strip())
+    return values
+
+
+def is_multi_valued_path(model, path):
+    """
+    Whether the relation `path` (ex: `device__location__user`) crosses a to-many relation and
+    needs `prefetch_related` instead of `select_related`.
+    """
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        if field.many_to_many or field.one_to_many:
+            return True
+        model = field.related_model
+    return False
+
+
 class QuerySetSerializer(serializers.ListSerializer):
     def to_representation(self, data):
         """
@@ -28,6 +53,8 @@ class QuerySetSerializer(serializers.ListSerializer):
             select_related_fields = getattr(meta, 'select_related_fields', [])
             select_related_fields = embeddable_fields + list(select_related_fields)
             iterable = iterable.select_related(*select_related_fields)
+            if isinstance(child, ModelSerializer):
+                iterable = child.optimize_queryset(iterable)
         return [
             self.child.to_representation(item) for item in iterable
         ]
@@ -40,10 +67,19 @@ class ModelSerializer(serializers.ModelSerializer):
     - By default, primary key of the resource will be returned.
     - If the `query_params` has an `embed` parameter with this field's name, then
     the resource will be embedded in the response
+
+    The top level serializer of a request also supports:
+
+    - `?fields=id,name` to only return the given fields of a read (GET, HEAD,
+    OPTIONS). The queryset is then restricted to the matching columns with `.only()`.
+    - `?embed=location_data` to opt into the nested objects declared in
+    `Meta.embed_fields`, a mapping of field name to the relation paths the field
+    reads. The queryset gets the matching `select_related` / `prefetch_related`.
+    Without a request in the context every embed field is returned.
     """
     def __init__(self, *args, **kwargs):
-        # The default for ModelSerializer is to embed the values
-        self.always_embed = kwargs.pop("always_embed", True)
+        # Nested resources are only embedded when the client asks for them
+        self.always_embed = kwargs.pop("always_embed", False)
         super(ModelSerializer, self).__init__(*args, **kwargs)
         self.error_messages.update({
             'incorrect_type': 'Incorrect type. Expected id value, received {data_type}.',
@@ -70,20 +106,105 @@ class ModelSerializer(serializers.ModelSerializer):
         list_serializer_class = getattr(meta, 'list_serializer_class', QuerySetSerializer)
         return list_serializer_class(*args, **list_kwargs)
 
+    def is_root(self):
+        """
+        Whether this is the top level serializer (or the child of a top level list serializer).
+        """
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_request(self):
+        if not self.is_root() or self.context.get('nested'):
+            return None
+        return self.context.get('request', None)
+
+    def get_fields(self):
+        fields = super(ModelSerializer, self).get_fields()
+        request = self.get_request()
+        if request is None:
+            return fields
+        embed_fields = getattr(getattr(self, 'Meta', None), 'embed_fields', {})
+        embed = get_query_param_list(request, 'embed')
+        for field_name in embed_fields:
+            if field_name not in embed:
+                fields.pop(field_name, None)
+        requested = self.get_requested_fields(request)
+        if requested:
+            for field_name in list(fields):
+                if field_name not in requested:
+                    fields.pop(field_name)
+        return fields
+
+    @staticmethod
+    def get_requested_fields(request):
+        """
+        Fields of `?fields=`. Only the reads are pruned, on writes the fields also validate and save
+        the submitted data.
+        """
+        if request.method not in SAFE_METHODS:
+            return []
+        return get_query_param_list(request, 'fields')
+
+    def get_nested_context(self):
+        """
+        Context for the serializers instantiated inside method fields. It shares the
+        `serializer_cache` of the request and embeds every field of the nested resource.
+        """
+        self.context.setdefault('serializer_cache', {})
+        context = dict(self.context)
+        context['nested'] = True
+        return context
+
+    def get_serializer_cache(self, name):
+        """
+        Per request dictionary to memoize representations shared by many rows (ex: users).
+        """
+        return self.context.setdefault('serializer_cache', {}).setdefault(name, {})
+
+    def optimize_queryset(self, queryset):
+        """
+        Adds the `select_related` / `prefetch_related` needed by the embedded fields and,
+        with `?fields=`, restricts the selected columns.
+        """
+        embed_fields = getattr(getattr(self, 'Meta', None), 'embed_fields', {})
+        model = queryset.model
+        paths = []
+        for field_name, field_paths in embed_fields.items():
+            if field_name in self.fields:
+                paths.extend(field_paths)
+        select_related = [path for path in paths if not is_multi_valued_path(model, path)]
+        prefetch_related = [path for path in paths if is_multi_valued_path(model, path)]
+        # Primary keys of to-many relations (ex: `Location.user`) are read with one query per page too
+        prefetch_related += [field.source for field in self.fields.values()
+                             if isinstance(field, serializers.ManyRelatedField) and field.source not in prefetch_related]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        request = self.get_request()
+        if request is not None and self.get_requested_fields(request):
+            concrete = set(field.name for field in model._meta.concrete_fields)
+            columns = set(field.source for field in self.fields.values() if field.source in concrete)
+            columns.update(path.split('__')[0] for path in select_related)
+            columns.add(model._meta.pk.name)
+            queryset = queryset.only(*columns)
+        return queryset
+
     def is_embeddable(self):
         # If the serializer should always be embedded
-        if self.always_embed is True:
+        if self.always_embed is True or self.is_root():
+            return True
+
+        # Without a request the client can not choose, embed the resource
+        if self.context.get('request', None) is None:
             return True
 
         # Check if the client is requesting to embed the resource
         request = self.context.get('request', None)
-        assert request is not None, (
-            "`%s` requires the request in the serializer if it is optionally embeddable"
-            " context. Add `context={'request': request}` when instantiating "
-            "the serializer." % self.__class__.__name__
-        )
-
-        embed_fields = request.query_params.getlist("embed")
+        embed_fields = get_query_param_list(request, "embed")
         return self.field_name in embed_fields
 
     def get_value(self, dictionary):
@@ -45,6 +45,31 @@ def localtime(date_obj):
     return timezone.localtime(date_obj)
 
 
+def to_utc_index(values):
+    """
+    :param values: sequence of aware datetimes or NumPy datetime64 array of UTC timestamps
+    :return: UTC `pandas.DatetimeIndex` of the values
+    """
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True))
+
+
+def localtime_array(values):
+    """
+    Vectorized `localtime(value).replace(tzinfo=None)` over a sequence of UTC timestamps.
+    :return: NumPy array of naive local datetimes
+    """
+    index = to_utc_index(values).tz_convert(timezone.get_current_timezone_name()).tz_localize(None)
+    return index.to_pydatetime()
+
+
+def epoch_ms_array(values):
+    """
+    Milliseconds since the unix epoch of a sequence of UTC timestamps, as a NumPy int64 array.
+    """
+    index = to_utc_index(values)
+    return ((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+
+
 def get_today_start():
     """
     :return: Start Date (YYYY-MM-DD HH:MM:SS): 2016-03-1 00:00:00
@@ -2,7 +2,8 @@ from rest_framework import routers
 from django.urls import path, include
 
 from .accounts.viewsets import UserViewSet
-from .adminapp.viewsets import LocationViewSet, DeviceViewSet, InverterDataViewSet, ZipReportViewSet
+from .adminapp.viewsets import LocationViewSet, DeviceViewSet, InverterDataViewSet, ZipReportViewSet, \
+    AlarmEventViewSet
 
 router = routers.DefaultRouter()
 
@@ -12,6 +13,7 @@ router.register(r'location', LocationViewSet, basename='v1_location')
 router.register(r'device', DeviceViewSet, basename='v1_device')
 router.register(r'inverter', InverterDataViewSet, basename='v1_inverter')
 router.register(r'report', ZipReportViewSet, basename='v1_report')
+router.register(r'alarm', AlarmEventViewSet, basename='v1_alarm')
 
 
 urlpatterns = [
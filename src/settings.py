@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 import dj_database_url
-from decouple import config
+from celery.schedules import crontab
+from decouple import config, Csv
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -60,6 +61,9 @@ APPS = [
 INSTALLED_APPS = DJANGO_APPS + LIBS + APPS
 
 MIDDLEWARE = [
+    'src.base.profiling.ProfilingMiddleware',
+    'src.base.metrics.MetricsMiddleware',
+    'src.base.queries.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -139,11 +143,67 @@ STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'src.base.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',)
 }
 
+# CACHE SETTINGS
+# Redis in production (`CACHE_URL=redis://host:6379/1`), process local memory otherwise.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'surya',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'surya',
+        }
+    }
+# Default lifetime, in seconds, of the cached viewset actions. The version counters invalidating them
+# live in the cache too: with the process local cache another worker only sees the invalidation when
+# its entries expire, hence the shorter default.
+APP_CACHE_TIMEOUT = config('APP_CACHE_TIMEOUT', default=300 if CACHE_URL else 30, cast=int)
+# The fleet overview of the administrators is only cached briefly, it shows the live power.
+FLEET_OVERVIEW_CACHE_TIMEOUT = config('FLEET_OVERVIEW_CACHE_TIMEOUT', default=60, cast=int)
+
+# Per process cache of the authentication tokens, invalidated in every worker through the version counters
+# of the shared cache (`CACHE_URL`), entries live at most TOKEN_CACHE_TTL seconds.
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', default=60, cast=int)
+
+# Broker of the live updates pub/sub: `memory://` (single process) or a Redis URL.
+PUBSUB_URL = config('PUBSUB_URL', default='memory://')
+# Period of the beat task publishing the devices gone offline to the live clients.
+LIVE_STATUS_CHECK_SECONDS = config('LIVE_STATUS_CHECK_SECONDS', default=60, cast=int)
+
+# METRICS SETTINGS
+# The Prometheus endpoint (/metrics/) requires the `Authorization: Bearer <METRICS_TOKEN>` header, it
+# is disabled without token. Behind a reverse proxy every request comes from the proxy address, the
+# address allow-list alone does not protect it.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+
+# Share of the requests whose queries are checked against the `<action>_query_budget` declarations,
+# violations are logged, or raised when QUERY_BUDGET_RAISE is set (tests).
+QUERY_BUDGET_SAMPLE_RATE = config('QUERY_BUDGET_SAMPLE_RATE', default=0.1, cast=float)
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=False, cast=bool)
+
+# Superusers can profile a request with `?profile=cprofile|sampling`, the profiles are kept in PROFILE_ROOT.
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILE_ROOT = config('PROFILE_ROOT', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILE_SAMPLING_INTERVAL = config('PROFILE_SAMPLING_INTERVAL', default=0.001, cast=float)
+
+# Unpaginated (`?pagination=false`) listings are streamed in chunks, up to a hard row limit.
+STREAMING_RESPONSE_CHUNK_SIZE = config('STREAMING_RESPONSE_CHUNK_SIZE', default=500, cast=int)
+STREAMING_RESPONSE_MAX_ROWS = config('STREAMING_RESPONSE_MAX_ROWS', default=100000, cast=int)
+
 # SWAGGER SETTINGS
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -161,8 +221,38 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend', 'static')
 STATIC_URL = '/static/'
 MEDIA_URL = config('DOMAIN') + '/media/'
 
+# REPORT CACHE SETTINGS
+REPORT_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'report-cache')
+REPORT_CACHE_MAX_BYTES = config('REPORT_CACHE_MAX_BYTES', default=5 * 1024 ** 3, cast=int)
+
+# TELEMETRY RETENTION SETTINGS
+# Raw readings and payloads older than these many days are archived and deleted, the daily rollups
+# are kept forever. Soft deleted readings go after INACTIVE_TELEMETRY_RETENTION_DAYS.
+RAW_TELEMETRY_RETENTION_DAYS = config('RAW_TELEMETRY_RETENTION_DAYS', default=90, cast=int)
+RAW_PAYLOAD_RETENTION_DAYS = config('RAW_PAYLOAD_RETENTION_DAYS', default=30, cast=int)
+INACTIVE_TELEMETRY_RETENTION_DAYS = config('INACTIVE_TELEMETRY_RETENTION_DAYS', default=7, cast=int)
+TELEMETRY_ARCHIVE_ROOT = config('TELEMETRY_ARCHIVE_ROOT', default=os.path.join(BASE_DIR, 'archive'))
+
+# DOWNTIME ANALYSIS SETTINGS
+# Readings are expected every TELEMETRY_INTERVAL_SECONDS. Readings further apart than
+# DOWNTIME_GAP_SECONDS (3 missed readings by default, so that jitter is not an outage) are an outage.
+# Ranges longer than DOWNTIME_RAW_MAX_DAYS use the daily rollups.
+TELEMETRY_INTERVAL_SECONDS = config('TELEMETRY_INTERVAL_SECONDS', default=300, cast=int)
+DOWNTIME_GAP_SECONDS = config('DOWNTIME_GAP_SECONDS', default=3 * TELEMETRY_INTERVAL_SECONDS, cast=int)
+DOWNTIME_RAW_MAX_DAYS = config('DOWNTIME_RAW_MAX_DAYS', default=31, cast=int)
+
 # CELERY SETTINGS
 BROKER_URL = config('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = config('CELERY_BROKER_URL')
 CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_TASK_SERIALIZER = 'json'
+CELERYBEAT_SCHEDULE = {
+    'apply-telemetry-retention': {
+        'task': 'src.adminapp.tasks.apply_retention_policy',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'publish-device-status': {
+        'task': 'src.adminapp.tasks.publish_device_status',
+        'schedule': LIVE_STATUS_CHECK_SECONDS,
+    },
+}
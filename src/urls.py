@@ -22,6 +22,7 @@ from django.urls import re_path
 from django.conf import settings
 from django.views.static import serve
 
+from .base.metrics import metrics_view
 from .routers import router
 
 schema_view = get_schema_view(
@@ -40,6 +41,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include(router.urls)),
+    path('metrics/', metrics_view, name='metrics'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),